@@ -13,7 +13,58 @@ S3_ENDPOINT = getenv("S3_ENDPOINT", "http://localhost:9000")
 S3_ACCESS_KEY = getenv("S3_ACCESS_KEY", "access_key")
 S3_SECRET_KEY = getenv("S3_SECRET_KEY", "secret_key")
 S3_REGION = getenv("S3_REGION", "us-east-1")
+S3_MULTIPART_THRESHOLD = int(getenv("S3_MULTIPART_THRESHOLD", str(64 * 1024**2)))
+S3_MULTIPART_CHUNKSIZE = int(getenv("S3_MULTIPART_CHUNKSIZE", str(16 * 1024**2)))
+S3_MAX_CONCURRENCY = int(getenv("S3_MAX_CONCURRENCY", "10"))
+S3_USE_CRT = int(getenv("S3_USE_CRT", "0"))
+S3_MAX_POOL_CONNECTIONS = int(getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_DELETE_CONCURRENCY = int(getenv("S3_DELETE_CONCURRENCY", "4"))
+STORAGE_BACKEND = getenv("STORAGE_BACKEND", "s3")
+LOCAL_STORAGE_PATH = pathlib.Path(
+    getenv("LOCAL_STORAGE_PATH", "~/.local/share/dmagma/storage")
+).expanduser()
 BUCKET_FUZZ_RESULTS = getenv("BUCKET_FUZZ_RESULTS", "fuzz-results")
 BUCKET_REPORTS = getenv("BUCKET_REPORTS", "reports")
 MAGMA_PATH = pathlib.Path(getenv("MAGMA_PATH", "magma"))
+MAGMA_REVISION = getenv("MAGMA_REVISION")
 FUZZING_TASK_QUEUE = getenv("FUZZING_TASK_QUEUE", "fuzzing-queue")
+BUILD_TASK_QUEUE = getenv("BUILD_TASK_QUEUE", "build-queue")
+BUILD_STAGE = int(getenv("BUILD_STAGE", "1"))
+BUILD_LOCK_TIMEOUT = int(getenv("BUILD_LOCK_TIMEOUT", str(4 * 3600)))
+FUZZING_RESERVED_CORES = int(getenv("FUZZING_RESERVED_CORES", "0"))
+RESOURCES_PATH = pathlib.Path(
+    getenv("RESOURCES_PATH", "~/.cache/dmagma/resources.json")
+).expanduser()
+FUZZING_SLOTS = int(getenv("FUZZING_SLOTS", "0"))
+INSPECT_TIMEOUT = float(getenv("INSPECT_TIMEOUT", "1"))
+DISPATCH_INTERVAL = int(getenv("DISPATCH_INTERVAL", "30"))
+DISPATCH_LOCK_TIMEOUT = int(getenv("DISPATCH_LOCK_TIMEOUT", "60"))
+CAMPAIGN_STATE_TTL = int(getenv("CAMPAIGN_STATE_TTL", str(7 * 24 * 3600)))
+RESOURCES_RETRY_DELAY = int(getenv("RESOURCES_RETRY_DELAY", "30"))
+RESOURCES_MAX_RETRIES = int(getenv("RESOURCES_MAX_RETRIES", "120"))
+WORKDIR_SYNC = int(getenv("WORKDIR_SYNC", "1"))
+SYNC_BATCH = int(getenv("SYNC_BATCH", "64"))
+CHECKPOINT_POLLS = int(getenv("CHECKPOINT_POLLS", "12"))
+CLEANUP_IN_BACKGROUND = int(getenv("CLEANUP_IN_BACKGROUND", "1"))
+REDUCE_CONCURRENCY = int(getenv("REDUCE_CONCURRENCY", "8"))
+RESULT_CACHE_SIZE = int(getenv("RESULT_CACHE_SIZE", str(10 * 1024**3)))
+RESULT_CACHE_PATH = pathlib.Path(
+    getenv("RESULT_CACHE_PATH", "~/.cache/dmagma/results")
+).expanduser()
+REPORT_SHARD_BY = getenv("REPORT_SHARD_BY", "target")
+REPORT_CONCURRENCY = int(getenv("REPORT_CONCURRENCY", "0"))
+PACK_CODEC = getenv("PACK_CODEC", "tar")
+PACK_LEVEL = int(getenv("PACK_LEVEL")) if getenv("PACK_LEVEL") else None
+BUILD_CACHE = int(getenv("BUILD_CACHE", "1"))
+BUILD_CACHE_PATH = pathlib.Path(
+    getenv("BUILD_CACHE_PATH", "~/.cache/dmagma/builds")
+).expanduser()
+BUILD_CACHE_REGISTRY = getenv("BUILD_CACHE_REGISTRY")
+BUCKET_BUILDS = getenv("BUCKET_BUILDS", "builds")
+METRICS = int(getenv("METRICS", "1"))
+METRICS_PORT = int(getenv("METRICS_PORT", "0"))
+METRICS_PATH = pathlib.Path(
+    getenv("METRICS_PATH", "~/.cache/dmagma/metrics")
+).expanduser()
+DATASET = int(getenv("DATASET", "1"))
+REPORT_SITE = int(getenv("REPORT_SITE", "1"))
@@ -1,13 +1,73 @@
-from typing import List, Optional, Union
+import pathlib
+import re
+import shlex
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
 
-from pydantic import BaseModel, validator, constr, PositiveInt
+from pydantic import BaseModel, validator, conint, constr, PositiveInt
 
 from backend import config
 
 
 NAME_CONSTRAINT = constr(regex=r"[\w-]+")
-FUZZERS = {path.name for path in (config.MAGMA_PATH / "fuzzers").iterdir()}
-TARGETS = {path.name for path in (config.MAGMA_PATH / "targets").iterdir()}
+PROGRAMS_REGEX = re.compile(r"^\s*PROGRAMS=\(([^)]*)\)", re.MULTILINE)
+
+
+def get_mtime(path: pathlib.Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class MagmaRegistry:
+    """
+    Fuzzers, targets and target programs of the Magma checkout. Discovered on
+    the first use and rescanned only when the modification time changes
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._cache: Dict[pathlib.Path, Tuple[Optional[int], FrozenSet[str]]] = {}
+
+    def _cached(self, path: pathlib.Path, scan) -> FrozenSet[str]:
+        mtime = get_mtime(path)
+        with self._lock:
+            cached = self._cache.get(path, None)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        names = frozenset(scan(path)) if mtime is not None else frozenset()
+        with self._lock:
+            self._cache[path] = (mtime, names)
+        return names
+
+    @staticmethod
+    def _scan_dir(path: pathlib.Path) -> List[str]:
+        return [entry.name for entry in path.iterdir() if entry.is_dir()]
+
+    @staticmethod
+    def _scan_configrc(path: pathlib.Path) -> List[str]:
+        match = PROGRAMS_REGEX.search(path.read_text())
+        return shlex.split(match.group(1), comments=True) if match else []
+
+    def fuzzers(self) -> FrozenSet[str]:
+        return self._cached(self._path / "fuzzers", self._scan_dir)
+
+    def targets(self) -> FrozenSet[str]:
+        return self._cached(self._path / "targets", self._scan_dir)
+
+    def programs(self, target: str) -> FrozenSet[str]:
+        """
+        :param target: target name
+        :return: programs declared by the target "configrc"
+        """
+        return self._cached(
+            self._path / "targets" / target / "configrc", self._scan_configrc
+        )
+
+
+registry = MagmaRegistry(config.MAGMA_PATH)
 
 
 def validate_uniqueness(v: List[Union["Program", "Target", "Fuzzer"]]):
@@ -19,6 +79,7 @@ def validate_uniqueness(v: List[Union["Program", "Target", "Fuzzer"]]):
 class Program(BaseModel):
     name: NAME_CONSTRAINT
     args: Optional[str]
+    trials: Optional[PositiveInt]
 
 
 class Target(BaseModel):
@@ -29,9 +90,21 @@ class Target(BaseModel):
     def unique_arguments(cls, v: List[Program]):
         return validate_uniqueness(v)
 
+    @validator("programs")
+    def declared(cls, v: List[Program], values: dict):
+        target = values.get("name", None)
+        if target:
+            programs = registry.programs(target)
+            for program in v:
+                if program.name not in programs:
+                    raise ValueError(
+                        f'Program "{program.name}" of "{target}" does not exists'
+                    )
+        return v
+
     @validator("name")
     def exists(cls, v: str):
-        if v not in TARGETS:
+        if v not in registry.targets():
             raise ValueError(f'Target "{v}" does not exists')
         return v
 
@@ -39,6 +112,9 @@ class Target(BaseModel):
 class Fuzzer(BaseModel):
     name: NAME_CONSTRAINT
     targets: List[Target]
+    cores: Optional[PositiveInt]
+    memory: Optional[PositiveInt]
+    trials: Optional[PositiveInt]
 
     @validator("targets")
     def unique_arguments(cls, v: List[Target]):
@@ -46,7 +122,7 @@ class Fuzzer(BaseModel):
 
     @validator("name")
     def exists(cls, v: str):
-        if v not in FUZZERS:
+        if v not in registry.fuzzers():
             raise ValueError(f'Fuzzer "{v}" does not exists')
         return v
 
@@ -56,6 +132,11 @@ class Campaign(BaseModel):
     poll: PositiveInt
     timeout: PositiveInt
     fuzzers: List[Fuzzer]
+    cores: PositiveInt = 1
+    memory: Optional[PositiveInt]
+    reuse: bool = False
+    trials: PositiveInt = 1
+    priority: conint(ge=0, le=9) = 0
 
     @validator("fuzzers")
     def unique_arguments(cls, v: List[Fuzzer]):
@@ -1,12 +1,25 @@
+import errno
+import functools
+import inspect
+import logging
+import os
 import pathlib
-from typing import Iterable
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import BaseClient
 from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 
 from backend import config, exceptions
 
+logger = logging.getLogger("storage")
+
 
 class StorageException(exceptions.BackendException):
     """Basic storage exception"""
@@ -20,23 +33,75 @@ class NotFoundException(StorageException):
     pass
 
 
+class ObjectInfo(NamedTuple):
+    key: str
+    etag: str
+    size: int
+
+
 class Storage:
-    def put(self, file: pathlib.Path, key: str):
+    def put(self, file: pathlib.Path, key: str, content_type: str = None):
+        """
+        Upload the object from the file
+
+        :param file: uploaded file
+        :param key: object name
+        :param content_type: media type served with the object, if the storage
+            keeps it
+        """
         raise NotImplementedError()
 
     def get(self, key: str, file: pathlib.Path):
         raise NotImplementedError()
 
+    def put_stream(self, stream: BinaryIO, key: str):
+        """
+        Upload the object from the sequentially readable stream
+
+        :param stream: readable binary file-like object
+        :param key: object name
+        """
+        raise NotImplementedError()
+
+    def get_stream(self, key: str) -> BinaryIO:
+        """
+        Open the object for the sequential reading
+
+        :param key: object name
+        :return: readable binary file-like object, has to be closed by the caller
+        """
+        raise NotImplementedError()
+
     def list(self, prefix: str = None) -> Iterable[str]:
         raise NotImplementedError()
 
+    def scan(self, prefix: str = None) -> Iterable[ObjectInfo]:
+        """
+        List the objects with their versions
+
+        :param prefix: object names prefix
+        :return: objects info, the etag changes with the object content
+        """
+        raise NotImplementedError()
+
     def delete(self, key: str):
         raise NotImplementedError()
 
+    def delete_prefix(self, prefix: str):
+        """
+        Delete all objects which names start with the prefix
+
+        :param prefix: object names prefix
+        """
+        raise NotImplementedError()
+
     def clear(self):
         raise NotImplementedError()
 
 
+DELETE_BATCH_SIZE = 1000
+
+
 class S3StorageException(StorageException):
     """S3(boto3) errors wrapper"""
 
@@ -55,7 +120,8 @@ def boto_errors_handler(func):
             error = e.response.get("Error", None)
             if error:
                 message = error.get("Message", None)
-                if message == "Not Found":
+                code = error.get("Code", None)
+                if message == "Not Found" or code in ("NoSuchKey", "NoSuchBucket"):
                     raise S3NotFoundException()
             raise S3StorageException(str(e))
         except BotoCoreError as e:
@@ -64,6 +130,106 @@ def boto_errors_handler(func):
     return wrapper
 
 
+def transfer_config_factory(
+    multipart_threshold: int = config.S3_MULTIPART_THRESHOLD,
+    multipart_chunksize: int = config.S3_MULTIPART_CHUNKSIZE,
+    max_concurrency: int = config.S3_MAX_CONCURRENCY,
+    use_crt: bool = bool(config.S3_USE_CRT),
+) -> TransferConfig:
+    """
+    Managed transfer settings: objects above the threshold are transferred
+    in parallel parts of the chunk size
+
+    :param multipart_threshold: minimal object size of the multipart transfer
+    :param multipart_chunksize: part size
+    :param max_concurrency: maximum number of the threads per transfer
+    :param use_crt: use the AWS CRT transfer client (requires "boto3[crt]"),
+        ignored by the boto3 versions without the transfer client selection
+    :return: boto3 transfer config
+    """
+    kwargs = {}
+    if use_crt:
+        if "preferred_transfer_client" in inspect.signature(TransferConfig).parameters:
+            kwargs["preferred_transfer_client"] = "crt"
+        else:
+            logger.warning("boto3 does not support the CRT transfer client")
+    return TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency,
+        **kwargs,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def default_transfer_config() -> TransferConfig:
+    return transfer_config_factory()
+
+
+def s3_client_factory(
+    endpoint: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    max_retries: int = 5,
+    max_pool_connections: int = config.S3_MAX_POOL_CONNECTIONS,
+) -> BaseClient:
+    retries = {"max_attempts": max_retries, "mode": "standard"}
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        config=Config(
+            signature_version="s3v4",
+            retries=retries,
+            max_pool_connections=max_pool_connections,
+        ),
+        region_name=region,
+    )
+
+
+class S3Registry:
+    """
+    Process-level registry of the thread-safe S3 clients and the buckets known
+    to exist. Must be reset in the forked processes (see "worker_process_init")
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str, str], BaseClient] = {}
+        self._buckets: Set[Tuple[str, str]] = set()
+
+    def client(
+        self, endpoint: str, access_key: str, secret_key: str, region: str
+    ) -> BaseClient:
+        key = (endpoint, access_key, region)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = s3_client_factory(
+                    endpoint, access_key, secret_key, region
+                )
+            return self._clients[key]
+
+    def bucket_exists(self, client: BaseClient, bucket: str) -> bool:
+        return (client.meta.endpoint_url, bucket) in self._buckets
+
+    def set_bucket_exists(self, client: BaseClient, bucket: str, exists: bool):
+        with self._lock:
+            if exists:
+                self._buckets.add((client.meta.endpoint_url, bucket))
+            else:
+                self._buckets.discard((client.meta.endpoint_url, bucket))
+
+    def reset(self):
+        with self._lock:
+            self._clients.clear()
+            self._buckets.clear()
+
+
+registry = S3Registry()
+
+
 class S3Storage(Storage):
     def __init__(
         self,
@@ -73,73 +239,343 @@ class S3Storage(Storage):
         region: str,
         bucket: str,
         max_retries: int = 5,
+        transfer_config: TransferConfig = None,
+        client: BaseClient = None,
     ):
-        retries = {"max_attempts": max_retries, "mode": "standard"}
-        self._s3 = boto3.resource(
-            "s3",
-            endpoint_url=endpoint,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            config=Config(signature_version="s3v4", retries=retries),
-            region_name=region,
+        self._client = client or s3_client_factory(
+            endpoint, access_key, secret_key, region, max_retries
         )
         self._bucket = bucket
-        self._bucket_created = False
+        self._transfer_config = transfer_config or default_transfer_config()
 
     @property
     def bucket(self) -> str:
         return self._bucket
 
-    def _exists(self) -> bool:
-        try:
-            self._s3.meta.client.head_bucket(Bucket=self.bucket)
-        except ClientError:
-            return False
-        return True
+    @property
+    def transfer_config(self) -> TransferConfig:
+        return self._transfer_config
 
-    @boto_errors_handler
-    def put(self, file: pathlib.Path, key: str):
-        if not self._bucket_created:
+    def _create_bucket(self):
+        if not registry.bucket_exists(self._client, self.bucket):
             try:
-                self._s3.create_bucket(Bucket=self.bucket)
+                self._client.create_bucket(Bucket=self.bucket)
             except (
-                self._s3.meta.client.exceptions.BucketAlreadyOwnedByYou,
-                self._s3.meta.client.exceptions.BucketAlreadyExists,
+                self._client.exceptions.BucketAlreadyOwnedByYou,
+                self._client.exceptions.BucketAlreadyExists,
             ):
                 pass
-            self._bucket_created = True
-        self._s3.meta.client.upload_file(str(file.absolute()), self.bucket, key)
+            registry.set_bucket_exists(self._client, self.bucket, True)
+
+    @boto_errors_handler
+    def put(self, file: pathlib.Path, key: str, content_type: str = None):
+        self._create_bucket()
+        self._client.upload_file(
+            str(file.absolute()),
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type} if content_type else None,
+            Config=self.transfer_config,
+        )
+
+    @boto_errors_handler
+    def put_stream(self, stream: BinaryIO, key: str):
+        self._create_bucket()
+        self._client.upload_fileobj(
+            stream, self.bucket, key, Config=self.transfer_config
+        )
 
     @boto_errors_handler
     def get(self, key: str, file: pathlib.Path):
-        self._s3.meta.client.download_file(self.bucket, key, str(file.absolute()))
+        self._client.download_file(
+            self.bucket, key, str(file.absolute()), Config=self.transfer_config
+        )
+
+    @boto_errors_handler
+    def get_stream(self, key: str) -> BinaryIO:
+        return self._client.get_object(Bucket=self.bucket, Key=key)["Body"]
 
     @boto_errors_handler
     def list(self, prefix: str = None) -> Iterable[str]:
-        if prefix:
-            objects = self._s3.Bucket(self.bucket).objects.filter(Prefix=prefix)
-        else:
-            objects = self._s3.Bucket(self.bucket).objects.all()
-        for obj in objects:
-            yield obj.key
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix or ""):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    @boto_errors_handler
+    def scan(self, prefix: str = None) -> Iterable[ObjectInfo]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix or ""):
+            for obj in page.get("Contents", []):
+                yield ObjectInfo(obj["Key"], obj["ETag"].strip('"'), obj["Size"])
 
     @boto_errors_handler
     def delete(self, key: str):
-        self._s3.meta.client.delete_object(Bucket=self.bucket, Key=key)
+        try:
+            self._client.delete_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            # nothing to delete, as of the missing object
+            if e.response.get("Error", {}).get("Code", None) != "NoSuchBucket":
+                raise
+
+    def _delete_batch(self, keys: List[str]):
+        response = self._client.delete_objects(
+            Bucket=self.bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = response.get("Errors", None)
+        if errors:
+            raise S3StorageException(f"Unable to delete {len(errors)} objects")
+
+    def _delete_prefix(self, prefix: str, concurrency: int):
+        paginator = self._client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.bucket,
+            Prefix=prefix,
+            PaginationConfig={"PageSize": DELETE_BATCH_SIZE},
+        )
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    self._delete_batch, [obj["Key"] for obj in page["Contents"]]
+                )
+                for page in pages
+                if page.get("Contents", None)
+            ]
+            for future in futures:
+                future.result()
+
+    @boto_errors_handler
+    def delete_prefix(
+        self, prefix: str, concurrency: int = config.S3_DELETE_CONCURRENCY
+    ):
+        """
+        Delete the objects page by page, up to DELETE_BATCH_SIZE objects per request
+
+        :param prefix: object names prefix
+        :param concurrency: maximum number of the pages deleted simultaneously
+        """
+        try:
+            self._delete_prefix(prefix, concurrency)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code", None) != "NoSuchBucket":
+                raise
 
     @boto_errors_handler
     def clear(self):
-        if self._exists():
-            for key in self.list():
-                self.delete(key)
-            self._s3.Bucket(self.bucket).delete()
+        try:
+            self._delete_prefix("", config.S3_DELETE_CONCURRENCY)
+            self._client.delete_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code", None) != "NoSuchBucket":
+                raise
+        registry.set_bucket_exists(self._client, self.bucket, False)
 
 
 def s3_factory(bucket: str) -> S3Storage:
+    """
+    :param bucket: bucket name
+    :return: storage over the S3 client shared within the process
+    """
     return S3Storage(
         config.S3_ENDPOINT,
         config.S3_ACCESS_KEY,
         config.S3_SECRET_KEY,
         config.S3_REGION,
         bucket,
+        client=registry.client(
+            config.S3_ENDPOINT,
+            config.S3_ACCESS_KEY,
+            config.S3_SECRET_KEY,
+            config.S3_REGION,
+        ),
     )
+
+
+COPY_CHUNK_SIZE = 1024**2
+
+
+class LocalStorageException(StorageException):
+    """Local filesystem errors wrapper"""
+
+    pass
+
+
+class LocalNotFoundException(LocalStorageException, NotFoundException):
+    pass
+
+
+def os_errors_handler(func):
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except FileNotFoundError:
+            raise LocalNotFoundException()
+        except OSError as e:
+            raise LocalStorageException(str(e))
+
+    return wrapper
+
+
+def copy_file(src: pathlib.Path, dst: pathlib.Path):
+    """
+    Copy the file content in the kernel with copy_file_range, the filesystems
+    with the reflinks (btrfs, xfs) share the extents instead of copying
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        try:
+            copied = 0
+            while copied < size:
+                count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if not count:
+                    break
+                copied += count
+            return
+        except (AttributeError, OSError) as e:
+            if isinstance(e, OSError) and e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+            ):
+                raise
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+
+class LocalStorage(Storage):
+    """
+    Storage over the directory tree "{path}/{bucket}/{key}" for the single-host
+    and test deployments. Objects are written to a temporary file and renamed
+    into place, so they are never modified in place and the readers always see
+    the whole object. Files are copied with copy_file_range, not hard linked:
+    the fuzzers rewrite the workdir files in place
+    """
+
+    def __init__(self, path: pathlib.Path, bucket: str):
+        self.bucket = bucket
+        self._root = path / bucket
+        self._tmp = path / f".{bucket}.tmp"
+
+    def _path(self, key: str) -> pathlib.Path:
+        parts = key.split("/")
+        if not key or any(part in ("", ".", "..") for part in parts):
+            raise LocalStorageException(f'Invalid object name "{key}"')
+        return self._root.joinpath(*parts)
+
+    def _tmp_file(self) -> pathlib.Path:
+        self._tmp.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=self._tmp)
+        os.close(fd)
+        return pathlib.Path(name)
+
+    def _commit(self, tmp: pathlib.Path, key: str):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(tmp, path)
+
+    def _prune(self, folder: pathlib.Path):
+        """Remove the empty parent folders of the deleted objects"""
+        while self._root in folder.parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+            folder = folder.parent
+
+    @os_errors_handler
+    def put(self, file: pathlib.Path, key: str, content_type: str = None):
+        tmp = self._tmp_file()
+        try:
+            copy_file(file, tmp)
+            self._commit(tmp, key)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    @os_errors_handler
+    def get(self, key: str, file: pathlib.Path):
+        copy_file(self._path(key), file)
+
+    @os_errors_handler
+    def put_stream(self, stream: BinaryIO, key: str):
+        tmp = self._tmp_file()
+        try:
+            with open(tmp, "wb") as fd:
+                shutil.copyfileobj(stream, fd, COPY_CHUNK_SIZE)
+            self._commit(tmp, key)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    @os_errors_handler
+    def get_stream(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def _walk(self, prefix: str) -> Iterator[Tuple[str, os.stat_result]]:
+        folder = self._root.joinpath(*prefix.rpartition("/")[0].split("/"))
+        entries = []
+        for root, _, files in os.walk(folder):
+            for file in files:
+                path = pathlib.Path(root) / file
+                key = path.relative_to(self._root).as_posix()
+                if key.startswith(prefix):
+                    entries.append((key, path))
+        # the same lexicographical order as S3
+        for key, path in sorted(entries):
+            try:
+                yield key, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def list(self, prefix: str = None) -> Iterable[str]:
+        for key, _ in self._walk(prefix or ""):
+            yield key
+
+    def scan(self, prefix: str = None) -> Iterable[ObjectInfo]:
+        for key, stat in self._walk(prefix or ""):
+            etag = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+            yield ObjectInfo(key, etag, stat.st_size)
+
+    @os_errors_handler
+    def delete(self, key: str):
+        path = self._path(key)
+        path.unlink(missing_ok=True)
+        self._prune(path.parent)
+
+    @os_errors_handler
+    def delete_prefix(self, prefix: str):
+        folder = prefix.rstrip("/")
+        if prefix.endswith("/") and folder and self._path(folder).is_dir():
+            # the folder is moved aside at once and removed after
+            self._tmp.mkdir(parents=True, exist_ok=True)
+            trash = pathlib.Path(tempfile.mkdtemp(dir=self._tmp))
+            os.rename(self._path(folder), trash / "folder")
+            shutil.rmtree(trash)
+            self._prune(self._path(folder).parent)
+            return
+        for key in list(self.list(prefix)):
+            self.delete(key)
+
+    @os_errors_handler
+    def clear(self):
+        shutil.rmtree(self._root, ignore_errors=True)
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def local_factory(bucket: str) -> LocalStorage:
+    return LocalStorage(config.LOCAL_STORAGE_PATH, bucket)
+
+
+STORAGE_FACTORIES = {"s3": s3_factory, "local": local_factory}
+
+
+def storage_factory(bucket: str) -> Storage:
+    """
+    :param bucket: bucket name
+    :return: storage of the configured backend (STORAGE_BACKEND)
+    """
+    if config.STORAGE_BACKEND not in STORAGE_FACTORIES:
+        raise StorageException(f'Unknown storage backend "{config.STORAGE_BACKEND}"')
+    return STORAGE_FACTORIES[config.STORAGE_BACKEND](bucket)
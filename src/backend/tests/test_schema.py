@@ -24,3 +24,31 @@ def test_invalid_target(program):
     with pytest.raises(pydantic.ValidationError) as e:
         schema.Target(name="unknown-target-name", programs=[program])
     assert "not exists" in str(e.value)
+
+
+def test_invalid_program(target):
+    program = schema.Program(name="unknown-program-name")
+    with pytest.raises(pydantic.ValidationError) as e:
+        schema.Target(name=target, programs=[program])
+    assert "not exists" in str(e.value)
+
+
+def test_registry(tmp_path):
+    registry = schema.MagmaRegistry(tmp_path)
+    assert not registry.fuzzers()
+    (tmp_path / "fuzzers" / "afl").mkdir(parents=True)
+    (tmp_path / "targets" / "libtiff").mkdir(parents=True)
+    configrc = tmp_path / "targets" / "libtiff" / "configrc"
+    configrc.write_text('PROGRAMS=(tiffcp\n  "tiff_read_rgba_fuzzer")\n')
+    assert registry.fuzzers() == {"afl"}
+    assert registry.targets() == {"libtiff"}
+    assert registry.programs("libtiff") == {"tiffcp", "tiff_read_rgba_fuzzer"}
+    assert not registry.programs("unknown-target-name")
+
+
+def test_trials(campaign):
+    assert campaign.trials == 1
+    campaign = schema.Campaign.parse_obj({**campaign.dict(), "trials": 3})
+    assert campaign.trials == 3
+    with pytest.raises(pydantic.ValidationError):
+        schema.Program(name="program", trials=0)
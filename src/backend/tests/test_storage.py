@@ -1,11 +1,11 @@
 from typing import Callable, Generator
+import io
 import pathlib
 
 import pytest
 
 from backend import storage
 
-
 TEST_OBJECTS_ROOT = "root/child"
 TEST_DUMMY_OBJECT = f"{TEST_OBJECTS_ROOT}/test-dummy-object"
 
@@ -19,9 +19,9 @@ def s3(clear_cache) -> storage.S3Storage:
 
 
 @pytest.fixture
-def dummy_file() -> Callable[
-    [pytest.TempPathFactory], Generator[pathlib.Path, None, None]
-]:
+def dummy_file() -> (
+    Callable[[pytest.TempPathFactory], Generator[pathlib.Path, None, None]]
+):
     def dummy(
         tmp_path_factory: pytest.TempPathFactory,
     ) -> Generator[pathlib.Path, None, None]:
@@ -53,6 +53,14 @@ def test_s3_get(s3, tmp_path_factory, dummy_file):
     s3.get(object_name, out_file)
 
 
+def test_s3_content_type(s3, tmp_path_factory, dummy_file):
+    file = next(dummy_file(tmp_path_factory))
+    object_name = f"{TEST_OBJECTS_ROOT}/test-s3-content-type.html"
+    s3.put(file, object_name, content_type="text/html")
+    head = s3._client.head_object(Bucket=s3.bucket, Key=object_name)
+    assert head["ContentType"] == "text/html"
+
+
 def test_s3_list(s3, tmp_path_factory, dummy_object):
     dummy_object()
     prefix = f"{TEST_OBJECTS_ROOT}/test-s3-list"
@@ -63,8 +71,117 @@ def test_s3_list(s3, tmp_path_factory, dummy_object):
         assert key.startswith(prefix)
 
 
+def test_s3_scan(s3, dummy_object):
+    prefix = f"{TEST_OBJECTS_ROOT}/test-s3-scan"
+    dummy_object(prefix)
+    objects = list(s3.scan(prefix=prefix))
+    assert [obj.key for obj in objects] == list(s3.list(prefix=prefix))
+    for obj in objects:
+        assert obj.etag and obj.size
+
+
 def test_s3_delete(s3, dummy_object, tmp_path_factory, dummy_file):
     key = dummy_object()
     s3.delete(key)
     with pytest.raises(storage.S3NotFoundException):
         s3.get(key, next(dummy_file(tmp_path_factory)))
+
+
+def test_s3_delete_prefix(s3, dummy_object):
+    prefix = f"{TEST_OBJECTS_ROOT}/test-s3-delete-prefix"
+    keep = dummy_object()
+    for i in range(3):
+        dummy_object(f"{prefix}/{i}")
+    s3.delete_prefix(prefix)
+    assert not list(s3.list(prefix=prefix))
+    assert keep in s3.list(prefix=keep)
+
+
+def test_s3_clear_missing_bucket():
+    storage.s3_factory("test-missing-bucket").clear()
+
+
+def test_s3_delete_missing_bucket():
+    missing = storage.s3_factory("test-missing-bucket")
+    missing.delete_prefix(f"{TEST_OBJECTS_ROOT}/")
+    missing.delete(TEST_DUMMY_OBJECT)
+
+
+def test_s3_stream(s3):
+    object_name = f"{TEST_OBJECTS_ROOT}/test-s3-stream"
+    content = b"dummy-content" * 1024
+    s3.put_stream(io.BytesIO(content), object_name)
+    stream = s3.get_stream(object_name)
+    try:
+        assert stream.read() == content
+    finally:
+        stream.close()
+
+
+def test_s3_transfer_config():
+    transfer_config = storage.transfer_config_factory(multipart_chunksize=8 * 1024**2)
+    s3_storage = storage.S3Storage(
+        "http://localhost:9000",
+        "access_key",
+        "secret_key",
+        "us-east-1",
+        "test-bucket",
+        transfer_config=transfer_config,
+    )
+    assert s3_storage.transfer_config.multipart_chunksize == 8 * 1024**2
+
+
+def test_s3_factory_shares_client(s3):
+    other = storage.s3_factory("test-other-bucket")
+    assert other._client is s3._client
+
+
+@pytest.fixture
+def local(tmp_path) -> storage.LocalStorage:
+    return storage.LocalStorage(tmp_path / "storage", "test-bucket")
+
+
+def test_local_put_get(local, tmp_path):
+    file = tmp_path / "file"
+    file.write_bytes(b"content")
+    local.put(file, TEST_DUMMY_OBJECT)
+    file.write_bytes(b"changed")
+    result = tmp_path / "result"
+    local.get(TEST_DUMMY_OBJECT, result)
+    assert result.read_bytes() == b"content"
+    with pytest.raises(storage.NotFoundException):
+        local.get("missing", result)
+    with pytest.raises(storage.StorageException):
+        local.put(file, "../escape")
+
+
+def test_local_stream(local):
+    local.put_stream(io.BytesIO(b"content"), TEST_DUMMY_OBJECT)
+    with local.get_stream(TEST_DUMMY_OBJECT) as stream:
+        assert stream.read() == b"content"
+
+
+def test_local_list_delete(local):
+    keys = [f"{TEST_OBJECTS_ROOT}/b", f"{TEST_OBJECTS_ROOT}/a/c", "root/children"]
+    for key in keys:
+        local.put_stream(io.BytesIO(key.encode()), key)
+    assert list(local.list(prefix=f"{TEST_OBJECTS_ROOT}/")) == sorted(keys[:2])
+    assert list(local.list(prefix=TEST_OBJECTS_ROOT)) == sorted(keys)
+    objects = list(local.scan(prefix=f"{TEST_OBJECTS_ROOT}/"))
+    assert [obj.size for obj in objects] == [len(key) for key in sorted(keys[:2])]
+    local.put_stream(io.BytesIO(b"new"), keys[0])
+    assert list(local.scan(prefix=f"{TEST_OBJECTS_ROOT}/"))[1].etag != objects[1].etag
+    local.delete_prefix(f"{TEST_OBJECTS_ROOT}/")
+    assert list(local.list()) == keys[2:]
+    local.delete(keys[2])
+    assert not list(local.list())
+    local.clear()
+
+
+def test_storage_factory(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage.config, "STORAGE_BACKEND", "local")
+    monkeypatch.setattr(storage.config, "LOCAL_STORAGE_PATH", tmp_path)
+    assert isinstance(storage.storage_factory("bucket"), storage.LocalStorage)
+    monkeypatch.setattr(storage.config, "STORAGE_BACKEND", "unknown")
+    with pytest.raises(storage.StorageException):
+        storage.storage_factory("bucket")
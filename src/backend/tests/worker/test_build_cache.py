@@ -0,0 +1,65 @@
+import pathlib
+
+import pytest
+
+from backend.worker import service
+from backend.worker.build_cache import BuildCache
+
+
+@pytest.fixture
+def magma_path(tmp_path, fuzzer, target) -> pathlib.Path:
+    root = tmp_path / "magma"
+    for path in (f"fuzzers/{fuzzer}", f"targets/{target}", "docker", "magma"):
+        (root / path).mkdir(parents=True)
+        (root / path / "file").write_text(path)
+    (root / "tools/captain").mkdir(parents=True)
+    (root / "tools/captain/build.sh").write_text("build")
+    return root
+
+
+@pytest.fixture
+def build_cache(tmp_path, magma_path) -> BuildCache:
+    return BuildCache(tmp_path / "cache", magma_path)
+
+
+def test_digest_is_stable(build_cache, fuzzer, target):
+    assert build_cache.digest(fuzzer, target) == build_cache.digest(fuzzer, target)
+
+
+def test_digest_tracks_inputs(build_cache, magma_path, fuzzer, target):
+    digest = build_cache.digest(fuzzer, target)
+    (magma_path / "targets" / target / "file").write_text("patched")
+    assert build_cache.digest(fuzzer, target) != digest
+
+
+def test_record(build_cache, fuzzer, target):
+    assert build_cache.get(fuzzer, target) is None
+    with build_cache.lock(fuzzer, target):
+        build_cache.put(fuzzer, target, "digest", "image-id")
+    assert build_cache.get(fuzzer, target) == {
+        "digest": "digest",
+        "image_id": "image-id",
+    }
+
+
+def test_pull_stale_image(monkeypatch, build_cache, fuzzer, target):
+    images = {service.get_image_name(fuzzer, target): "stale-id"}
+    builds = []
+
+    def build(fuzzer: str, target: str):
+        builds.append((fuzzer, target))
+        images[service.get_image_name(fuzzer, target)] = "fresh-id"
+
+    monkeypatch.setattr(service, "get_image_id", images.get)
+    monkeypatch.setattr(service, "_build", build)
+    with build_cache.lock(fuzzer, target):
+        build_cache.put(fuzzer, target, "other-inputs", "stale-id")
+    service.pull(fuzzer, target, build_cache)
+    assert builds == [(fuzzer, target)]
+    assert build_cache.get(fuzzer, target) == {
+        "digest": build_cache.digest(fuzzer, target),
+        "image_id": "fresh-id",
+    }
+    # the image of the current inputs is used as is
+    service.pull(fuzzer, target, build_cache)
+    assert len(builds) == 1
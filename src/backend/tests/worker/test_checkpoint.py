@@ -0,0 +1,79 @@
+import pathlib
+import uuid
+
+import pytest
+
+from backend import storage
+from backend.worker.checkpoint import Checkpointer, merge_monitor, shift_monitor
+from backend.worker.sync import WorkdirSync
+
+
+@pytest.fixture(scope="module")
+def results_storage(clear_cache) -> storage.Storage:
+    results = storage.storage_factory("test-checkpoints")
+    yield results
+    if clear_cache:
+        results.clear()
+
+
+@pytest.fixture
+def workdir(tmp_path) -> pathlib.Path:
+    workdir = tmp_path / "workdir"
+    (workdir / "corpus").mkdir(parents=True)
+    (workdir / "monitor").mkdir()
+    (workdir / "corpus" / "seed").write_text("seed")
+    (workdir / "monitor" / "0").write_text("0")
+    (workdir / "monitor" / "5").write_text("5")
+    return workdir
+
+
+def test_checkpoint_restore(results_storage, tmp_path, workdir, campaign_id):
+    pipeline_id = str(uuid.uuid4())
+    sync = WorkdirSync(results_storage, campaign_id, workdir)
+    checkpointer = Checkpointer(results_storage, campaign_id, pipeline_id, sync)
+    assert checkpointer.restore() == 0
+    checkpointer.save(5)
+    (workdir / "corpus" / "new").write_text("new")
+    checkpointer.save(10)
+
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    resumed_sync = WorkdirSync(results_storage, campaign_id, restored)
+    resumed = Checkpointer(results_storage, campaign_id, pipeline_id, resumed_sync)
+    assert resumed.restore() == 10
+    assert (restored / "corpus" / "new").read_text() == "new"
+    assert sorted(p.name for p in (restored / "monitor").iterdir()) == ["0", "5"]
+
+    # monitor dumps of the resumed run are stored with the offset
+    (restored / "monitor" / "0").rename(tmp_path / "0")
+    (restored / "monitor" / "5").rename(tmp_path / "5")
+    (restored / "monitor" / "0").write_text("10")
+    resumed.save(10)
+    assert sorted(resumed_sync.manifest()["files"]) == [
+        "corpus/new",
+        "corpus/seed",
+        "monitor/0",
+        "monitor/10",
+        "monitor/5",
+    ]
+    resumed.delete()
+    assert resumed.restore() == 0
+
+
+def test_merge_monitor(tmp_path):
+    restored, monitor = tmp_path / "restored", tmp_path / "monitor"
+    restored.mkdir()
+    monitor.mkdir()
+    for timestamp in ("0", "5", "10"):
+        (restored / timestamp).write_text("old")
+    for timestamp in ("0", "5"):
+        (monitor / timestamp).write_text("new")
+    shift_monitor(monitor, 10)
+    merge_monitor(restored, monitor)
+    assert not restored.exists()
+    assert {p.name: p.read_text() for p in monitor.iterdir()} == {
+        "0": "old",
+        "5": "old",
+        "10": "new",
+        "15": "new",
+    }
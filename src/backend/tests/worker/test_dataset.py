@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from backend import storage
+from backend.worker import dataset
+from backend.worker.result_cache import ResultCache
+
+
+@pytest.fixture(scope="module")
+def reports_storage(clear_cache) -> storage.Storage:
+    reports = storage.storage_factory("test-dataset")
+    yield reports
+    if clear_cache:
+        reports.clear()
+
+
+@pytest.fixture(scope="module")
+def fixture_report(report_json_file) -> dict:
+    with open(report_json_file) as fd:
+        return json.load(fd)
+
+
+def test_flatten_report(fixture_report):
+    df = dataset.flatten_report("campaign", fixture_report)
+    assert list(df.columns) == dataset.COLUMNS
+    runs = fixture_report["results"]["libfuzzer"]["libpng"]["libpng_read_fuzzer"]
+    png003 = df[(df["fuzzer"] == "libfuzzer") & (df["bug"] == "PNG003")]
+    assert png003["reached"].tolist() == [runs["0"]["reached"]["PNG003"]]
+    assert png003["triggered"].tolist() == [runs["0"]["triggered"]["PNG003"]]
+    assert df[df["bug"] == "PNG001"]["triggered"].isna().all()
+
+
+def test_partition_values():
+    values = dataset.get_partition_values(
+        [
+            ("fuzzer", "in", ["afl", "libfuzzer"]),
+            ("fuzzer", "==", "afl"),
+            ("campaign", "=", "c"),
+            ("reached", "<", 10),
+        ]
+    )
+    assert values == {"fuzzer": {"afl"}, "campaign": {"c"}}
+
+
+def test_query(reports_storage, fixture_report, campaign_id, tmp_path):
+    other_id = f"{campaign_id}-other"
+    for name in (campaign_id, other_id):
+        keys = dataset.write_dataset(reports_storage, name, fixture_report, tmp_path)
+        assert len(keys) == sum(map(len, fixture_report["results"].values()))
+    expected = dataset.flatten_report(campaign_id, fixture_report)
+    expected = expected[(expected["fuzzer"] == "libfuzzer")]
+
+    filters = [("campaign", "==", campaign_id), ("fuzzer", "==", "libfuzzer")]
+    assert len(dataset.find_partitions(reports_storage, filters)) == len(
+        fixture_report["results"]["libfuzzer"]
+    )
+    df = dataset.query(reports_storage, ["target", "bug", "reached"], filters)
+    assert list(df.columns) == ["target", "bug", "reached"]
+    assert len(df) == len(expected)
+
+    filters = [("campaign", "in", [campaign_id, other_id]), ("bug", "==", "PNG003")]
+    cache = ResultCache(tmp_path / "cache", 1024**2)
+    for _ in range(2):
+        df = dataset.query(
+            reports_storage, ["campaign", "triggered"], filters, cache=cache
+        )
+        assert sorted(df["campaign"].unique()) == sorted([campaign_id, other_id])
+    assert dataset.query(reports_storage, filters=[("fuzzer", "==", "none")]).empty
+
+    dataset.delete_dataset(reports_storage, other_id)
+    df = dataset.query(reports_storage, ["campaign"], filters)
+    assert df["campaign"].unique().tolist() == [campaign_id]
+    assert not dataset.get_campaign_partitions(reports_storage, other_id)
+    # deleting the missing dataset is a no-op
+    dataset.delete_dataset(reports_storage, other_id)
+
+
+def test_write_dataset_dropped_slice(
+    reports_storage, fixture_report, campaign_id, tmp_path
+):
+    name = f"{campaign_id}-dropped"
+    keys = dataset.write_dataset(reports_storage, name, fixture_report, tmp_path)
+    report = {"results": dict(fixture_report["results"])}
+    fuzzer = next(iter(report["results"]))
+    del report["results"][fuzzer]
+    kept = dataset.write_dataset(reports_storage, name, report, tmp_path)
+    assert set(kept) < set(keys)
+    for key in set(keys) - set(kept):
+        assert key not in reports_storage.list(prefix=key)
+    assert dataset.get_campaign_partitions(reports_storage, name) == kept
+    dataset.delete_dataset(reports_storage, name)
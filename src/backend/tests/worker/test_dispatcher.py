@@ -0,0 +1,83 @@
+import uuid
+from collections import Counter
+
+import pytest
+import redis
+
+from backend import config
+from backend.worker.dispatcher import Dispatcher
+
+TEST_REDIS_DB = 15
+
+
+@pytest.fixture
+def dispatcher() -> Dispatcher:
+    client = redis.Redis(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        db=TEST_REDIS_DB,
+        decode_responses=True,
+    )
+    client.flushdb()
+    yield Dispatcher(client)
+    client.flushdb()
+
+
+def release_round(dispatcher: Dispatcher, capacity: int) -> Counter:
+    released = Counter()
+    for campaign_id, _ in dispatcher.next_round(capacity):
+        dispatcher.release(campaign_id, str(uuid.uuid4()))
+        released[campaign_id] += 1
+    return released
+
+
+def test_fair_share(dispatcher):
+    dispatcher.submit("huge", 0, [{"trial": i} for i in range(10)])
+    dispatcher.submit("small", 0, [{"trial": i} for i in range(2)])
+    assert release_round(dispatcher, 4) == {"huge": 2, "small": 2}
+    assert release_round(dispatcher, 4) == {"huge": 4}
+    assert dispatcher.inflight() == 8
+    assert dispatcher.pending() == 4
+
+
+def test_priority(dispatcher):
+    dispatcher.submit("huge", 0, [{"trial": i} for i in range(10)])
+    dispatcher.submit("urgent", 2, [{"trial": i} for i in range(10)])
+    assert release_round(dispatcher, 4) == {"urgent": 3, "huge": 1}
+
+
+def test_complete(dispatcher):
+    dispatcher.submit("campaign", 0, [{"trial": 0}, {"trial": 1}], ["reused"])
+    (campaign_id, _), (_, _) = dispatcher.next_round(2)
+    dispatcher.release(campaign_id, "first")
+    dispatcher.release(campaign_id, "second")
+    assert dispatcher.complete(campaign_id, "unknown") is None
+    assert dispatcher.complete(campaign_id, "first") is None
+    assert dispatcher.complete(campaign_id, "second", failed=True) == ["reused"]
+    assert dispatcher.complete(campaign_id, "second") is None
+    progress = dispatcher.progress(campaign_id)
+    assert progress["finished"]
+    assert progress["done"] == 2
+    assert progress["failed"] == 1
+
+
+def test_build_gating(dispatcher):
+    pipelines = [
+        {"fuzzer": "afl", "target": "libpng"},
+        {"fuzzer": "afl", "target": "libtiff"},
+        {"fuzzer": "afl", "target": "libtiff"},
+    ]
+    dispatcher.submit("campaign", 0, pipelines, ["reused"], gated=True)
+    assert not dispatcher.next_round(3)
+    assert dispatcher.progress("campaign")["building"] == 3
+    dispatcher.built("campaign", "afl", "libtiff")
+    released = dispatcher.next_round(3)
+    assert [kwargs["target"] for _, kwargs in released] == ["libtiff", "libtiff"]
+    for i, _ in enumerate(released):
+        dispatcher.release("campaign", str(i))
+        assert dispatcher.complete("campaign", str(i)) is None
+    assert dispatcher.build_failed("campaign", "afl", "libpng") == ["reused"]
+    progress = dispatcher.progress("campaign")
+    assert progress["finished"]
+    assert progress["building"] == 0
+    assert progress["failed"] == 1
@@ -0,0 +1,39 @@
+import subprocess
+import time
+
+import pytest
+
+from backend import config
+from backend.worker import metrics
+
+
+def test_phases():
+    task_metrics = metrics.TaskMetrics("fuzz")
+    for _ in range(2):
+        with task_metrics.phase("sync"):
+            pass
+    with pytest.raises(subprocess.CalledProcessError):
+        with task_metrics.phase("build"):
+            raise subprocess.CalledProcessError(2, "./build.sh")
+    task_metrics.add("uploaded_objects")
+    task_metrics.add("uploaded_bytes", 10)
+    result = task_metrics.as_dict()
+    assert result["phases"]["sync"]["count"] == 2
+    assert result["phases"]["sync"]["status"] == "ok"
+    assert result["phases"]["build"]["status"] == "failed"
+    assert result["phases"]["build"]["exit_code"] == 2
+    assert result["counters"] == {"uploaded_objects": 1, "uploaded_bytes": 10}
+
+
+def test_null_metrics():
+    with metrics.NULL_METRICS.phase("build"):
+        metrics.NULL_METRICS.add("uploaded_objects")
+    assert not metrics.NULL_METRICS.as_dict()["phases"]
+    assert not metrics.NULL_METRICS.as_dict()["counters"]
+
+
+def test_task_metrics(monkeypatch):
+    task_metrics = metrics.task_metrics("fuzz", time.time() - 5)
+    assert task_metrics.queue_wait >= 5
+    monkeypatch.setattr(config, "METRICS", 0)
+    assert metrics.task_metrics("fuzz") is None
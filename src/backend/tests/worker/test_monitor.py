@@ -0,0 +1,31 @@
+import pathlib
+
+import pytest
+
+from backend.worker.monitor import MonitorTail
+
+
+@pytest.fixture
+def monitor_dir(tmp_path) -> pathlib.Path:
+    monitor = tmp_path / "monitor"
+    monitor.mkdir()
+    return monitor
+
+
+def test_monitor_tail(tmp_path, monitor_dir):
+    tail = MonitorTail(tmp_path)
+    assert not tail.poll()
+    (monitor_dir / "0").write_text("PNG001_R,PNG001_T,PNG003_R,PNG003_T\n1,0,0,0\n")
+    (monitor_dir / "5").write_text("PNG001_R,PNG001_T,PNG003_R,PNG003_T\n2,1,1,0\n")
+    assert tail.poll()
+    (monitor_dir / "10").write_text("PNG001_R,PNG001_T,PNG003_R,PNG003_T\n")
+    assert not tail.poll()
+    progress = tail.progress()
+    assert progress["elapsed"] == 5
+    assert progress["bugs"] == {
+        "reached": {"PNG001": 0, "PNG003": 5},
+        "triggered": {"PNG001": 5},
+    }
+    (monitor_dir / "10").write_text("PNG001_R,PNG001_T,PNG003_R,PNG003_T\n3,1,1,1\n")
+    assert tail.poll()
+    assert tail.progress()["triggered"] == 2
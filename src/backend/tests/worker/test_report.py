@@ -0,0 +1,61 @@
+import json
+import pathlib
+
+import pytest
+
+from backend.worker import service
+
+
+@pytest.fixture(scope="module")
+def fixture_report(report_json_file) -> dict:
+    with open(report_json_file) as fd:
+        return json.load(fd)
+
+
+@pytest.fixture
+def workdir(tmp_path, fixture_report) -> pathlib.Path:
+    """exp2json.py workdir with the monitor dumps reproducing the fixture"""
+    workdir = tmp_path / "workdir"
+    for fuzzer, targets in fixture_report["results"].items():
+        for target, programs in targets.items():
+            for program, runs in programs.items():
+                for run, events in runs.items():
+                    monitor = (
+                        workdir / "ar" / fuzzer / target / program / run / "monitor"
+                    )
+                    monitor.mkdir(parents=True)
+                    columns = {
+                        f"{bug}{suffix}": time
+                        for suffix, event in (("_R", "reached"), ("_T", "triggered"))
+                        for bug, time in events[event].items()
+                    }
+                    timestamps = {0, *columns.values()}
+                    for timestamp in sorted(timestamps):
+                        values = [int(t <= timestamp) for t in columns.values()]
+                        (monitor / str(timestamp)).write_text(
+                            ",".join(columns) + "\n" + ",".join(map(str, values)) + "\n"
+                        )
+    return workdir
+
+
+@pytest.mark.parametrize("shard_by", ["fuzzer", "target"])
+def test_merge_reports(tmp_path, fixture_report, shard_by):
+    reports = []
+    for fuzzer, targets in fixture_report["results"].items():
+        shards = {None: targets} if shard_by == "fuzzer" else targets
+        for target, programs in shards.items():
+            shard = {fuzzer: programs if target is None else {target: programs}}
+            report = tmp_path / f"{len(reports)}.json"
+            report.write_text(json.dumps({"results": shard}))
+            reports.append(report)
+    assert service.merge_reports(reports) == fixture_report
+
+
+@pytest.mark.parametrize("shard_by", ["fuzzer", "target"])
+def test_generate_sharded_report(tmp_path, workdir, fixture_report, shard_by):
+    assert len(service.get_report_shards(workdir / "ar", shard_by)) > 1
+    report, sharded = tmp_path / "report.json", tmp_path / "sharded.json"
+    service.generate_report(workdir, report)
+    service.generate_sharded_report(workdir, sharded, shard_by, concurrency=2)
+    with open(report) as fd, open(sharded) as sharded_fd:
+        assert json.load(sharded_fd) == json.load(fd) == fixture_report
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from backend.worker.resources import ResourceAllocator, get_affinity
+
+
+@pytest.fixture
+def allocator(tmp_path) -> ResourceAllocator:
+    return ResourceAllocator(tmp_path / "resources.json", cores=[0, 1, 2], memory=1024)
+
+
+def test_acquire_release(allocator):
+    assert allocator.acquire("first", 2, 512) == [0, 1]
+    assert allocator.acquire("first", 2, 512) == [0, 1]
+    assert allocator.acquire("second", 2) is None
+    assert allocator.acquire("second", 1, 1024) is None
+    assert allocator.acquire("second", 1, 512) == [2]
+    allocator.release("first")
+    assert get_affinity(allocator.acquire("third", 2)) == "0,1"
+
+
+def test_fits(allocator):
+    assert allocator.fits(3, 1024)
+    assert allocator.fits(1)
+    assert not allocator.fits(4)
+    assert not allocator.fits(1, 2048)
+
+
+def test_dead_owner(allocator, tmp_path):
+    allocator.acquire("first", 3)
+    other = ResourceAllocator(tmp_path / "resources.json", cores=[0, 1, 2], memory=1)
+    assert other.acquire("second", 1) is None
+    leases = other.state()["leases"]
+    # beyond the maximal pid of linux
+    leases["first"]["pid"] = 2**22 + 1
+    (tmp_path / "resources.json").write_text(json.dumps(leases))
+    assert other.acquire("second", 1) == [0]
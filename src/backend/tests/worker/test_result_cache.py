@@ -0,0 +1,56 @@
+import pathlib
+import shutil
+
+import pytest
+
+from backend.worker.result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path) -> ResultCache:
+    return ResultCache(tmp_path / "cache", max_size=8)
+
+
+def materializer(content: str):
+    calls = []
+
+    def dummy(folder: pathlib.Path):
+        calls.append(folder)
+        (folder / "monitor").mkdir(parents=True)
+        (folder / "monitor" / "0").write_text(content)
+
+    return dummy, calls
+
+
+def test_fetch(cache, tmp_path):
+    materialize, calls = materializer("0123")
+    assert not cache.fetch("key", "etag", tmp_path / "a", materialize)
+    assert cache.fetch("key", "etag", tmp_path / "b", materialize)
+    assert len(calls) == 1
+    first, second = tmp_path / "a/monitor/0", tmp_path / "b/monitor/0"
+    assert second.read_text() == "0123"
+    assert first.stat().st_ino == second.stat().st_ino
+    # the changed object is fetched again
+    assert not cache.fetch("key", "etag-2", tmp_path / "c", materialize)
+    assert len(calls) == 2
+
+
+def test_eviction(cache, tmp_path):
+    for key in ("a", "b", "c"):
+        cache.fetch(key, "etag", tmp_path / key, materializer("0123")[0])
+    materialize, calls = materializer("0123")
+    assert cache.fetch("c", "etag", tmp_path / "c-2", materialize)
+    assert not cache.fetch("a", "etag", tmp_path / "a-2", materialize)
+    # evicted entries stay linked into the destination
+    assert (tmp_path / "a/monitor/0").read_text() == "0123"
+
+
+def test_eviction_missing_entry(cache, tmp_path):
+    cache.fetch("a", "etag", tmp_path / "a", materializer("0123")[0])
+    for entry in (tmp_path / "cache" / "entries").iterdir():
+        shutil.rmtree(entry)
+    for key in ("b", "c"):
+        cache.fetch(key, "etag", tmp_path / key, materializer("0123")[0])
+    materialize, calls = materializer("0123")
+    assert cache.fetch("b", "etag", tmp_path / "b-2", materialize)
+    assert not cache.fetch("a", "etag", tmp_path / "a-2", materialize)
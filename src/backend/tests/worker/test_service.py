@@ -1,6 +1,7 @@
+import io
 import logging
 import pathlib
-import tarfile
+import subprocess
 import uuid
 from typing import Callable, Generator
 
@@ -10,6 +11,7 @@ from docker import errors as docker_errors
 
 from backend import storage
 from backend.worker import utils, service
+from backend.worker.metrics import TaskMetrics
 
 BUILT_IMAGES = set()
 POLL = 1
@@ -62,7 +64,7 @@ def fuzzer_results(
 
 @pytest.fixture(scope="module")
 def results_storage(clear_cache) -> storage.Storage:
-    s3 = storage.s3_factory("test-fuzzing-results")
+    s3 = storage.storage_factory("test-fuzzing-results")
     yield s3
     if clear_cache:
         s3.clear()
@@ -70,7 +72,7 @@ def results_storage(clear_cache) -> storage.Storage:
 
 @pytest.fixture(scope="module")
 def reports_storage(clear_cache) -> storage.Storage:
-    s3 = storage.s3_factory("test-reports")
+    s3 = storage.storage_factory("test-reports")
     yield s3
     if clear_cache:
         s3.clear()
@@ -100,6 +102,22 @@ def fuzz_pipeline(
     return dummy
 
 
+def test_shell_wrapper_stream():
+    lines = []
+    output = service.shell_wrapper(
+        "for i in 1 2 3; do echo $i; done", on_line=lines.append, tail_lines=2
+    )
+    assert lines == ["1", "2", "3"]
+    assert output == "2\n3"
+
+
+def test_shell_wrapper_error():
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        service.shell_wrapper("echo failure >&2; exit 3")
+    assert e.value.returncode == 3
+    assert e.value.output == "failure"
+
+
 def test_build(docker_ctx, fuzzer, target):
     service.build(fuzzer, target)
     image = service.get_image_name(fuzzer, target)
@@ -114,12 +132,16 @@ def test_start(fuzzer_results, tmp_path):
     assert len(monitor_log)
 
 
-def test_pack(fuzzer_results, tmp_path_factory):
+@pytest.mark.parametrize("codec", list(service.CODECS))
+def test_pack_stream(fuzzer_results, tmp_path_factory, codec):
     workdir = fuzzer_results(tmp_path_factory.mktemp("workdir"))
-    archived = tmp_path_factory.mktemp("archived")
-    archive = service.pack(workdir, archived)
-    with tarfile.open(archive.absolute(), "r") as tar:
-        assert len(tar.getmembers())
+    archive = tmp_path_factory.mktemp("archived") / service.get_archive_name(codec)
+    with service.pack_stream(workdir, codec) as stream, open(archive, "wb") as fd:
+        fd.write(stream.read())
+    out_dir = tmp_path_factory.mktemp("unpacked")
+    with open(archive, "rb") as fd:
+        service.unpack_monitor(fd, out_dir, codec)
+    assert len(list((out_dir / "monitor").iterdir()))
 
 
 def test_run_fuzz_pipeline(
@@ -129,7 +151,8 @@ def test_run_fuzz_pipeline(
     workdir, shared = service.get_workdir_and_shared(
         p_id, tmp_path_factory.mktemp("workdir")
     )
-    tar = service.run_fuzz_pipeline(
+    metrics = TaskMetrics("fuzz")
+    result = service.run_fuzz_pipeline(
         campaign_id,
         p_id,
         fuzzer,
@@ -140,9 +163,13 @@ def test_run_fuzz_pipeline(
         POLL,
         TIMEOUT,
         results_storage,
+        metrics=metrics,
     )
-    results_file = tmp_path_factory.mktemp("fuzz-results") / pathlib.Path(tar).name
-    results_storage.get(tar, results_file)
+    results_file = tmp_path_factory.mktemp("fuzz-results") / pathlib.Path(result).name
+    results_storage.get(result, results_file)
+    assert {"build", "fuzz", "summarize"} <= set(metrics.phases)
+    assert metrics.counters["uploaded_objects"]
+    assert metrics.counters["uploaded_bytes"]
 
 
 def test_reduce(
@@ -157,4 +184,42 @@ def test_reduce(
 ):
     fuzz_pipeline(next(pipeline_id()), fuzzer, target, program)
     fuzz_pipeline(next(pipeline_id()), fuzzer, target, program)
-    service.reduce(campaign_id, results_storage, reports_storage)
+    metrics = TaskMetrics("reduce")
+    service.reduce(campaign_id, results_storage, reports_storage, metrics=metrics)
+    assert set(metrics.phases) == {"fetch", "report", "upload"}
+    assert metrics.counters["fetched_objects"] >= 2
+
+
+def test_index_result(results_storage, campaign_id, fuzzer, target, program):
+    key = service.get_pipeline_key(fuzzer, target, program, None, TIMEOUT, "rev")
+    assert key != service.get_pipeline_key(
+        fuzzer, target, program, None, TIMEOUT, "other-rev"
+    )
+    prefix = service.get_result_prefix(
+        campaign_id, fuzzer, target, program, str(uuid.uuid4())
+    )
+    results_storage.put_stream(io.BytesIO(b"{}"), f"{prefix}/manifest.json")
+    service.index_result(results_storage, key, prefix)
+    assert prefix in service.find_results(results_storage, key)
+
+
+def test_find_results_deleted(results_storage, campaign_id, fuzzer, target, program):
+    key = service.get_pipeline_key(fuzzer, target, program, None, TIMEOUT, "deleted")
+    prefixes = [
+        service.get_result_prefix(
+            campaign_id, fuzzer, target, program, str(uuid.uuid4())
+        )
+        for _ in range(2)
+    ]
+    for prefix in prefixes:
+        results_storage.put_stream(io.BytesIO(b"{}"), f"{prefix}/manifest.json")
+        service.index_result(results_storage, key, prefix)
+    # results removed without the index, e.g. by a lifecycle rule
+    results_storage.delete_prefix(f"{prefixes[0]}/")
+    assert service.find_results(results_storage, key) == prefixes[1:]
+    assert len(list(results_storage.list(prefix=f"_index/{key}/"))) == 1
+    # campaign deleted, the rerun with the reuse fuzzes all the trials again
+    results_storage.delete_prefix(f"{campaign_id}/")
+    service.delete_index(results_storage, campaign_id)
+    assert not list(results_storage.list(prefix=f"_index/{key}/"))
+    assert service.find_results(results_storage, key) == []
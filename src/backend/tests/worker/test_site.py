@@ -0,0 +1,65 @@
+import copy
+import io
+import json
+
+import pytest
+
+from backend import storage
+from backend.worker import service, site
+from backend.worker.metrics import TaskMetrics
+
+
+@pytest.fixture(scope="module")
+def reports_storage(clear_cache) -> storage.Storage:
+    reports = storage.storage_factory("test-site")
+    yield reports
+    if clear_cache:
+        reports.clear()
+
+
+@pytest.fixture(scope="module")
+def fixture_report(report_json_file) -> dict:
+    with open(report_json_file) as fd:
+        return json.load(fd)
+
+
+def put_report(reports_storage, campaign_id: str, report: dict):
+    reports_storage.put_stream(
+        io.BytesIO(json.dumps(report).encode()), service.get_report_key(campaign_id)
+    )
+
+
+def test_plot_slice(fixture_report, tmp_path):
+    programs = fixture_report["results"]["libfuzzer"]["libpng"]
+    site.plot_slice("libfuzzer/libpng", programs, str(tmp_path / "plot.svg"))
+    assert (tmp_path / "plot.svg").read_text().startswith("<?xml")
+
+
+def test_render_site(reports_storage, fixture_report, campaign_id):
+    slices = site.get_slices(fixture_report)
+    prefix = site.get_site_prefix(campaign_id)
+    # the report creates the bucket of a fresh endpoint
+    put_report(reports_storage, campaign_id, fixture_report)
+    reports_storage.delete_prefix(f"{prefix}/")
+    metrics = TaskMetrics("render_site")
+    result = site.render_site(campaign_id, reports_storage, metrics=metrics)
+    assert result == {"rendered": len(slices), "skipped": 0}
+    keys = set(reports_storage.list(prefix=f"{prefix}/"))
+    assert f"{prefix}/index.html" in keys
+    for fuzzer, target in slices:
+        assert f"{prefix}/{fuzzer}/{target}.html" in keys
+        assert f"{prefix}/{fuzzer}/{target}.svg" in keys
+    assert {"plots", "pages", "upload"} <= set(metrics.phases)
+
+    result = site.render_site(campaign_id, reports_storage)
+    assert result == {"rendered": 0, "skipped": len(slices)}
+
+    # the campaign is extended by the new run of the single slice
+    report = copy.deepcopy(fixture_report)
+    fuzzer, target = next(iter(slices))
+    programs = report["results"][fuzzer][target]
+    runs = next(iter(programs.values()))
+    runs["extra"] = copy.deepcopy(next(iter(runs.values())))
+    put_report(reports_storage, campaign_id, report)
+    result = site.render_site(campaign_id, reports_storage)
+    assert result == {"rendered": 1, "skipped": len(slices) - 1}
@@ -0,0 +1,70 @@
+import pathlib
+
+import pytest
+
+from backend import storage
+from backend.worker.sync import WorkdirSync, fetch_files
+
+
+@pytest.fixture(scope="module")
+def results_storage(clear_cache) -> storage.Storage:
+    results = storage.storage_factory("test-sync")
+    yield results
+    if clear_cache:
+        results.clear()
+
+
+@pytest.fixture
+def workdir(tmp_path) -> pathlib.Path:
+    workdir = tmp_path / "workdir"
+    (workdir / "corpus").mkdir(parents=True)
+    (workdir / "monitor").mkdir()
+    for name in ("a", "b", "c"):
+        (workdir / "corpus" / name).write_text(name)
+    (workdir / "corpus" / "a-copy").write_text("a")
+    (workdir / "monitor" / "0").write_text("0")
+    return workdir
+
+
+def test_sync(results_storage, workdir, campaign_id):
+    sync = WorkdirSync(results_storage, campaign_id, workdir)
+    # the duplicated content is uploaded once
+    assert sync.sync(limit=2) == 2
+    assert sync.sync() == 2
+    assert sync.sync() == 0
+    (workdir / "corpus" / "c").write_text("changed")
+    (workdir / "corpus" / "b").unlink()
+    assert sync.sync(prune=True) == 1
+    manifest = sync.manifest()
+    assert sorted(manifest["files"]) == [
+        "corpus/a",
+        "corpus/a-copy",
+        "corpus/c",
+        "monitor/0",
+    ]
+    assert manifest["files"]["corpus/a"] == manifest["files"]["corpus/a-copy"]
+
+
+def test_fetch_files(results_storage, tmp_path, workdir, campaign_id):
+    sync = WorkdirSync(results_storage, campaign_id, workdir)
+    sync.sync()
+    out_dir = tmp_path / "out"
+    fetch_files(results_storage, sync.manifest(), out_dir, folder="monitor")
+    assert [p.name for p in out_dir.iterdir()] == ["monitor"]
+    assert (out_dir / "monitor" / "0").read_text() == "0"
+
+
+@pytest.mark.parametrize("codec", ["gz", "zst"])
+def test_compressed_blobs(results_storage, tmp_path, workdir, campaign_id, codec):
+    sync = WorkdirSync(results_storage, campaign_id, workdir, codec=codec)
+    sync.sync()
+    manifest = sync.manifest()
+    digest = manifest["files"]["corpus/a"]
+    assert manifest["codec"] == codec
+    assert f"{manifest['blobs']}/{digest}.{codec}" in results_storage.list(
+        prefix=manifest["blobs"]
+    )
+    out_dir = tmp_path / "out"
+    fetch_files(results_storage, manifest, out_dir)
+    assert (out_dir / "corpus" / "a").read_text() == "a"
+    assert (out_dir / "monitor" / "0").read_text() == "0"
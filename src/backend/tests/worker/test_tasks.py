@@ -1,6 +1,10 @@
+import time
+import uuid
+
 import pytest
 
-from backend.worker import tasks
+from backend.worker import service, tasks
+from backend.worker.monitor import Poller
 
 
 @pytest.mark.celery
@@ -11,9 +15,31 @@ class TestTasks:
         report = task.get()
         assert report
 
+    def test_fuzz_progress(self, monkeypatch, campaign_id, fuzzer, target, program):
+        def run_fuzz_pipeline(*args):
+            progress = args[11]
+            # the progress is reported by the poller thread as in the pipeline
+            with Poller(0.01, lambda: progress({"elapsed": 1})):
+                time.sleep(0.1)
+            return "result"
+
+        monkeypatch.setattr(service, "run_fuzz_pipeline", run_fuzz_pipeline)
+        task_id = str(uuid.uuid4())
+        args = [campaign_id, fuzzer, target, program, 1, "10s"]
+        task = tasks.fuzz.apply(args=args, task_id=task_id)
+        assert task.get()["result"] == "result"
+        meta = tasks.fuzz.backend.get_task_meta(task_id)
+        assert meta["status"] == "PROGRESS"
+        assert meta["result"] == {"elapsed": 1}
+
     def test_start_campaign(self, campaign):
         campaign = campaign.dict(exclude_unset=True, exclude_none=True)
         task = tasks.start_campaign.apply_async(args=[campaign])
-        chord_task_id = task.get()
-        chord_result = tasks.app.AsyncResult(chord_task_id)
-        chord_result.get()
+        campaign_id = task.get()
+        while True:
+            status = tasks.campaign_status.apply_async(args=[campaign_id]).get()
+            if status["finished"] and status["report_task"]:
+                break
+            time.sleep(1)
+        assert not status["failed"]
+        tasks.app.AsyncResult(status["report_task"]).get()
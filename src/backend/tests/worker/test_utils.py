@@ -0,0 +1,52 @@
+import pathlib
+
+import pytest
+
+from backend.worker import utils
+
+
+@pytest.fixture
+def folder(tmp_path) -> pathlib.Path:
+    folder = tmp_path / "workdir"
+    (folder / "corpus" / "nested").mkdir(parents=True)
+    (folder / "corpus" / "nested" / "seed").write_text("seed")
+    (folder / "log").write_text("log")
+    (folder / "link").symlink_to(tmp_path)
+    return folder
+
+
+def test_cleanup_folder(tmp_path, folder):
+    utils.cleanup_folder(folder)
+    assert folder.exists()
+    assert not list(folder.iterdir())
+    assert tmp_path.exists()
+
+
+def test_cleanup_folder_background(tmp_path, folder):
+    thread = utils.cleanup_folder(folder, background=True)
+    assert not list(folder.iterdir())
+    thread.join()
+    assert list(tmp_path.iterdir()) == [folder]
+
+
+def test_merge_dicts():
+    dst = {"results": {"afl": {"libpng": {"0": 1}}}}
+    src = {"results": {"afl": {"libpng": {"1": 2}, "libtiff": {"0": 3}}}}
+    assert utils.merge_dicts(dst, src) == {
+        "results": {"afl": {"libpng": {"0": 1, "1": 2}, "libtiff": {"0": 3}}}
+    }
+
+
+@pytest.mark.parametrize(
+    "duration, seconds", [("15", 15), ("15s", 15), ("2m", 120), ("1.5h", 5400)]
+)
+def test_parse_duration(duration, seconds):
+    assert utils.parse_duration(duration) == seconds
+
+
+def test_link_tree(tmp_path, folder):
+    linked = tmp_path / "linked"
+    utils.link_tree(folder / "corpus", linked)
+    seed = linked / "nested" / "seed"
+    assert seed.read_text() == "seed"
+    assert seed.stat().st_ino == (folder / "corpus" / "nested" / "seed").stat().st_ino
@@ -0,0 +1,131 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+from typing import Iterable, Iterator, Optional
+
+from backend import config
+from backend.storage import NotFoundException, Storage, storage_factory
+
+BUILD_INPUTS = ("docker", "magma", "tools/captain/build.sh")
+
+
+def hash_tree(paths: Iterable[pathlib.Path], root: pathlib.Path) -> str:
+    """
+    Content hash of files and directories (recursively) relative to the root
+
+    :param paths: files or directories to hash
+    :param root: root which is excluded from the hashed names
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in files:
+            if not file.is_file():
+                continue
+            digest.update(str(file.relative_to(root)).encode())
+            digest.update(b"x" if os.access(file, os.X_OK) else b"-")
+            with open(file, "rb") as fd:
+                for chunk in iter(lambda: fd.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    Content-addressed index of the built fuzzer/target images
+
+    The local index lives in the worker filesystem, the optional shared manifest
+    is kept in the storage and points to the images pushed to a registry
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        magma_path: pathlib.Path = config.MAGMA_PATH,
+        storage: Storage = None,
+    ):
+        self._path = path
+        self._magma_path = magma_path
+        self._storage = storage
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def storage(self) -> Optional[Storage]:
+        return self._storage
+
+    def digest(self, fuzzer: str, target: str) -> str:
+        inputs = [self._magma_path / path for path in BUILD_INPUTS]
+        inputs.append(self._magma_path / "fuzzers" / fuzzer)
+        inputs.append(self._magma_path / "targets" / target)
+        return hash_tree(inputs, self._magma_path)
+
+    def _record_path(self, fuzzer: str, target: str) -> pathlib.Path:
+        return self._path / fuzzer / f"{target}.json"
+
+    @contextlib.contextmanager
+    def lock(self, fuzzer: str, target: str) -> Iterator[None]:
+        """Exclusive lock of the fuzzer/target pair among the processes of the host"""
+        lock_file = self._path / f"{fuzzer}--{target}.lock"
+        with open(lock_file, "w") as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def get(self, fuzzer: str, target: str) -> Optional[dict]:
+        try:
+            with open(self._record_path(fuzzer, target)) as fd:
+                return json.load(fd)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, fuzzer: str, target: str, digest: str, image_id: str):
+        record = self._record_path(fuzzer, target)
+        record.parent.mkdir(parents=True, exist_ok=True)
+        tmp = record.with_suffix(".tmp")
+        with open(tmp, "w") as fd:
+            json.dump({"digest": digest, "image_id": image_id}, fd)
+        tmp.replace(record)
+
+    @staticmethod
+    def _manifest_key(fuzzer: str, target: str, digest: str) -> str:
+        return f"{fuzzer}/{target}/{digest}.json"
+
+    def get_shared(self, fuzzer: str, target: str, digest: str) -> Optional[str]:
+        """
+        :return: registry reference of the image built from the same inputs
+        """
+        if not self._storage:
+            return None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest = pathlib.Path(tmp_dir) / "manifest.json"
+            try:
+                self._storage.get(self._manifest_key(fuzzer, target, digest), manifest)
+            except NotFoundException:
+                return None
+            with open(manifest) as fd:
+                return json.load(fd)["image"]
+
+    def put_shared(self, fuzzer: str, target: str, digest: str, image: str):
+        if not self._storage:
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest = pathlib.Path(tmp_dir) / "manifest.json"
+            with open(manifest, "w") as fd:
+                json.dump({"image": image, "digest": digest}, fd)
+            self._storage.put(manifest, self._manifest_key(fuzzer, target, digest))
+
+
+def build_cache_factory() -> Optional[BuildCache]:
+    if not config.BUILD_CACHE:
+        return None
+    shared = None
+    if config.BUILD_CACHE_REGISTRY:
+        shared = storage_factory(config.BUCKET_BUILDS)
+    return BuildCache(config.BUILD_CACHE_PATH, storage=shared)
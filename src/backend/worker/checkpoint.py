@@ -0,0 +1,83 @@
+import logging
+import os
+import pathlib
+import shutil
+
+from backend.storage import NotFoundException, Storage
+from backend.worker.sync import WorkdirSync, get_manifest, put_manifest
+
+logger = logging.getLogger("worker")
+CHECKPOINT_PREFIX = "_checkpoints"
+MANIFEST_NAME = "checkpoint.json"
+
+
+def get_checkpoint_prefix(campaign_id: str, pipeline_id: str = None) -> str:
+    prefix = f"{CHECKPOINT_PREFIX}/{campaign_id}"
+    return f"{prefix}/{pipeline_id}" if pipeline_id else prefix
+
+
+def shift_monitor(monitor: pathlib.Path, offset: int):
+    """
+    Shift the monitor dumps of the resumed run by the already fuzzed time
+
+    :param monitor: monitor dumps folder
+    :param offset: seconds fuzzed before the resume
+    """
+    timestamps = sorted((int(e.name) for e in monitor.iterdir() if e.name.isdigit()))
+    for timestamp in reversed(timestamps):
+        (monitor / str(timestamp)).replace(monitor / str(timestamp + offset))
+
+
+def merge_monitor(src: pathlib.Path, dst: pathlib.Path):
+    """Move the monitor dumps which are not in the destination"""
+    dst.mkdir(parents=True, exist_ok=True)
+    for entry in os.scandir(src):
+        if not (dst / entry.name).exists():
+            shutil.move(entry.path, dst / entry.name)
+    shutil.rmtree(src, ignore_errors=True)
+
+
+class Checkpointer:
+    """
+    Checkpoints of the pipeline workdir: every save syncs the changed files
+    and stores the workdir manifest with the fuzzed time
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        campaign_id: str,
+        pipeline_id: str,
+        sync: WorkdirSync,
+    ):
+        self._storage = storage
+        self._key = f"{get_checkpoint_prefix(campaign_id, pipeline_id)}/{MANIFEST_NAME}"
+        self._sync = sync
+
+    def save(self, elapsed: int):
+        """
+        :param elapsed: seconds fuzzed in total, including the restored run
+        """
+        uploaded = self._sync.sync()
+        put_manifest(
+            self._storage, {"elapsed": elapsed, **self._sync.manifest()}, self._key
+        )
+        logger.info(f"Checkpoint: {uploaded} files, {elapsed}s fuzzed")
+
+    def restore(self) -> int:
+        """
+        Download the last checkpoint into the workdir
+
+        :return: seconds fuzzed before the checkpoint
+        """
+        try:
+            manifest = get_manifest(self._storage, self._key)
+        except NotFoundException:
+            return 0
+        self._sync.restore(manifest)
+        self._sync.offset = manifest["elapsed"]
+        logger.info(f"Restored checkpoint: {manifest['elapsed']}s fuzzed")
+        return manifest["elapsed"]
+
+    def delete(self):
+        self._storage.delete(self._key)
@@ -0,0 +1,236 @@
+import datetime
+import pathlib
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from backend import config
+from backend.storage import NotFoundException, ObjectInfo, Storage
+from backend.worker.result_cache import ResultCache
+from backend.worker.sync import get_manifest, put_manifest
+
+DATASET_PREFIX = "_dataset"
+COLUMNS = [
+    "campaign",
+    "timestamp",
+    "fuzzer",
+    "target",
+    "program",
+    "run",
+    "bug",
+    "reached",
+    "triggered",
+]
+# "_dataset/fuzzer={fuzzer}/target={target}/{campaign}.parquet"
+PARTITION_KEY = re.compile(
+    rf"^{DATASET_PREFIX}/fuzzer=(?P<fuzzer>[^/]+)/target=(?P<target>[^/]+)"
+    r"/(?P<campaign>[^/]+)\.parquet$"
+)
+PARTITION_COLUMNS = ("fuzzer", "target", "campaign")
+# partitions written per campaign, "_" folders are skipped by the hive readers
+CAMPAIGNS_PREFIX = f"{DATASET_PREFIX}/_campaigns"
+Filter = Tuple[str, str, Any]
+
+
+def get_partition_prefix(fuzzer: str = None) -> str:
+    return f"{DATASET_PREFIX}/fuzzer={fuzzer}/" if fuzzer else f"{DATASET_PREFIX}/"
+
+
+def get_partition_key(campaign_id: str, fuzzer: str, target: str) -> str:
+    return f"{get_partition_prefix(fuzzer)}target={target}/{campaign_id}.parquet"
+
+
+def get_campaign_key(campaign_id: str) -> str:
+    return f"{CAMPAIGNS_PREFIX}/{campaign_id}.json"
+
+
+def get_campaign_partitions(storage: Storage, campaign_id: str) -> List[str]:
+    """
+    :param storage: storage of the dataset
+    :param campaign_id: campaign id
+    :return: object names of the partitions written for the campaign
+    """
+    try:
+        return get_manifest(storage, get_campaign_key(campaign_id))["partitions"]
+    except NotFoundException:
+        return []
+
+
+def flatten_report(
+    campaign_id: str, report: dict, timestamp: datetime.datetime = None
+) -> pd.DataFrame:
+    """
+    :param campaign_id: campaign id
+    :param report: campaign report, see exp2json.py
+    :param timestamp: time of the report, now if not defined
+    :return: row per run and bug with the reached and triggered times (seconds)
+    """
+    timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for fuzzer, targets in report["results"].items():
+        for target, programs in targets.items():
+            for program, runs in programs.items():
+                for run, events in runs.items():
+                    reached = events.get("reached", {})
+                    triggered = events.get("triggered", {})
+                    for bug in sorted({*reached, *triggered}):
+                        rows.append(
+                            (
+                                campaign_id,
+                                timestamp,
+                                fuzzer,
+                                target,
+                                program,
+                                run,
+                                bug,
+                                reached.get(bug),
+                                triggered.get(bug),
+                            )
+                        )
+    df = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    for column in ("reached", "triggered"):
+        df[column] = df[column].astype("Int64")
+    return df
+
+
+def write_dataset(
+    storage: Storage, campaign_id: str, report: dict, tmp_dir: pathlib.Path
+) -> List[str]:
+    """
+    Store the flattened report as the Parquet file per fuzzer/target partition,
+    rows are sorted by the bug, so the row group statistics prune the bugs
+
+    :param storage: storage of the dataset
+    :param campaign_id: campaign id
+    :param report: campaign report
+    :param tmp_dir: folder for the intermediate files
+    :return: object names of the partitions
+    """
+    df = flatten_report(campaign_id, report)
+    previous = get_campaign_partitions(storage, campaign_id)
+    keys = []
+    for (fuzzer, target), partition in df.groupby(["fuzzer", "target"]):
+        key = get_partition_key(campaign_id, fuzzer, target)
+        path = tmp_dir / f"{fuzzer}--{target}.parquet"
+        partition.sort_values(["bug", "program", "run"]).to_parquet(
+            path, index=False, compression="zstd"
+        )
+        storage.put(path, key)
+        keys.append(key)
+    put_manifest(storage, {"partitions": keys}, get_campaign_key(campaign_id))
+    # slices dropped from the report since the previous write
+    for key in set(previous) - set(keys):
+        storage.delete(key)
+    return keys
+
+
+def delete_dataset(storage: Storage, campaign_id: str):
+    """
+    Delete the partitions of the campaign, listed at the write time
+
+    :param storage: storage of the dataset
+    :param campaign_id: campaign id
+    """
+    for key in get_campaign_partitions(storage, campaign_id):
+        storage.delete(key)
+    storage.delete(get_campaign_key(campaign_id))
+
+
+def get_partition_values(filters: List[Filter]) -> Dict[str, Set[str]]:
+    """
+    :param filters: conjunction of the (column, op, value) predicates
+    :return: allowed values of the partition columns
+    """
+    values = {}
+    for column, op, value in filters:
+        if column not in PARTITION_COLUMNS:
+            continue
+        if op in ("=", "=="):
+            allowed = {value}
+        elif op == "in":
+            allowed = set(value)
+        else:
+            continue
+        values[column] = values.get(column, allowed) & allowed
+    return values
+
+
+def find_partitions(storage: Storage, filters: List[Filter] = None) -> List[ObjectInfo]:
+    """
+    :param storage: storage of the dataset
+    :param filters: see query
+    :return: partition objects which could match the filters
+    """
+    values = get_partition_values(filters or [])
+    prefixes = [get_partition_prefix()]
+    if "fuzzer" in values:
+        prefixes = [get_partition_prefix(fuzzer) for fuzzer in sorted(values["fuzzer"])]
+    partitions = []
+    for prefix in prefixes:
+        for obj in storage.scan(prefix=prefix):
+            match = PARTITION_KEY.match(obj.key)
+            if match and all(
+                match[column] in allowed for column, allowed in values.items()
+            ):
+                partitions.append(obj)
+    return partitions
+
+
+def query(
+    storage: Storage,
+    columns: List[str] = None,
+    filters: List[Filter] = None,
+    concurrency: int = config.REDUCE_CONCURRENCY,
+    cache: Optional[ResultCache] = None,
+) -> pd.DataFrame:
+    """
+    Load the campaign results matching the filters, e.g. the time to trigger
+    the bug per fuzzer:
+
+        df = query(
+            storage,
+            ["campaign", "fuzzer", "triggered"],
+            [("bug", "==", "AAH041"), ("campaign", "in", campaigns)],
+        )
+        df.groupby("fuzzer")["triggered"].median()
+
+    Only the partitions of the matching fuzzer/target/campaign are downloaded,
+    the rest of the predicates are pushed down to the Parquet row groups
+
+    :param storage: storage of the dataset
+    :param columns: loaded columns, all if not defined
+    :param filters: conjunction of the (column, op, value) predicates, see
+        pyarrow.parquet.read_table
+    :param concurrency: maximum number of the simultaneous downloads
+    :param cache: local cache of the downloaded partitions
+    :return: matching rows
+    """
+    partitions = find_partitions(storage, filters)
+    if not partitions:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    with tempfile.TemporaryDirectory(prefix="dataset") as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+
+        def load(i: int, obj: ObjectInfo) -> pd.DataFrame:
+            out_dir = tmp_dir / str(i)
+            name = obj.key.rsplit("/", 1)[1]
+
+            def materialize(folder: pathlib.Path):
+                folder.mkdir(parents=True, exist_ok=True)
+                storage.get(obj.key, folder / name)
+
+            if cache and obj.etag:
+                cache.fetch(obj.key, obj.etag, out_dir, materialize)
+            else:
+                materialize(out_dir)
+            return pd.read_parquet(
+                out_dir / name, columns=columns, filters=filters or None
+            )
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            frames = list(executor.map(load, range(len(partitions)), partitions))
+    return pd.concat(frames, ignore_index=True)
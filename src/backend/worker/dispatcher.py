@@ -0,0 +1,271 @@
+import heapq
+import json
+import uuid
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+import redis
+
+from backend import config
+
+KEY_PREFIX = "dmagma"
+CAMPAIGNS_KEY = f"{KEY_PREFIX}:campaigns"
+DISPATCH_LOCK_KEY = f"{KEY_PREFIX}:dispatch-lock"
+DISPATCH_SCHEDULED_KEY = f"{KEY_PREFIX}:dispatch-scheduled"
+CAMPAIGN_KEYS = (None, "pending", "released", "done", "failed", "builds")
+
+
+def get_campaign_key(campaign_id: str, name: str = None) -> str:
+    key = f"{KEY_PREFIX}:campaign:{campaign_id}"
+    return f"{key}:{name}" if name else key
+
+
+def get_build_name(fuzzer: str, target: str) -> str:
+    return f"{fuzzer}--{target}"
+
+
+def get_waiting_key(campaign_id: str, build: str) -> str:
+    return get_campaign_key(campaign_id, f"waiting:{build}")
+
+
+class Dispatcher:
+    """
+    Fair-share release of the campaigns pipelines into the fuzzing queue.
+    Pipelines are released in rounds: every free fuzzing slot goes to the
+    campaign with the lowest number of the running pipelines per weight
+    (priority + 1), so a huge campaign can not starve a small urgent one.
+
+    The state is kept in redis:
+        campaigns                 sorted set of the active campaigns by priority
+        campaign:{id}             hash of the campaign meta
+        campaign:{id}:pending     list of the pipelines (fuzz task kwargs)
+        campaign:{id}:released    set of the released pipeline ids
+        campaign:{id}:done        set of the finished pipeline ids
+        campaign:{id}:failed      set of the failed pipeline ids
+        campaign:{id}:builds      set of the fuzzer--target images in build
+        campaign:{id}:waiting:{build}
+                                  list of the pipelines waiting for the image
+    """
+
+    def __init__(self, client: redis.Redis):
+        self._client = client
+
+    def lock(self) -> redis.lock.Lock:
+        """Lock of the round release among the general workers"""
+        return self._client.lock(
+            DISPATCH_LOCK_KEY, timeout=config.DISPATCH_LOCK_TIMEOUT
+        )
+
+    def schedule(self, interval: int) -> bool:
+        """
+        :param interval: seconds till the next scheduled round
+        :return: whether the round is not scheduled yet
+        """
+        return bool(self._client.set(DISPATCH_SCHEDULED_KEY, 1, nx=True, ex=interval))
+
+    def submit(
+        self,
+        campaign_id: str,
+        priority: int,
+        pipelines: List[dict],
+        reused: List[str] = None,
+        gated: bool = False,
+    ):
+        """
+        :param campaign_id: campaign id
+        :param priority: campaign priority, higher gets the bigger share
+        :param pipelines: fuzz task kwargs of the pipelines
+        :param reused: result prefixes of the reused pipelines
+        :param gated: pipelines wait until their fuzzer/target image is built,
+            see built and build_failed
+        """
+        meta = {
+            "priority": priority,
+            "total": len(pipelines),
+            "reused": json.dumps(reused or []),
+        }
+        queues = defaultdict(list)
+        for pipeline in pipelines:
+            key = get_campaign_key(campaign_id, "pending")
+            if gated:
+                build = get_build_name(pipeline["fuzzer"], pipeline["target"])
+                key = get_waiting_key(campaign_id, build)
+            queues[key].append(json.dumps(pipeline))
+        builds = self._client.smembers(get_campaign_key(campaign_id, "builds"))
+        with self._client.pipeline() as pipe:
+            pipe.delete(
+                *(get_campaign_key(campaign_id, name) for name in CAMPAIGN_KEYS),
+                *(get_waiting_key(campaign_id, build) for build in builds),
+            )
+            pipe.hset(get_campaign_key(campaign_id), mapping=meta)
+            for key, queue in queues.items():
+                pipe.rpush(key, *queue)
+            if gated and pipelines:
+                pipe.sadd(
+                    get_campaign_key(campaign_id, "builds"),
+                    *{get_build_name(p["fuzzer"], p["target"]) for p in pipelines},
+                )
+            pipe.zadd(CAMPAIGNS_KEY, {campaign_id: priority})
+            pipe.execute()
+
+    def build_lock(self, fuzzer: str, target: str) -> redis.lock.Lock:
+        """Lock of the fuzzer/target image build among the build workers"""
+        return self._client.lock(
+            f"{KEY_PREFIX}:build-lock:{get_build_name(fuzzer, target)}",
+            timeout=config.BUILD_LOCK_TIMEOUT,
+        )
+
+    def _take_waiting(self, campaign_id: str, fuzzer: str, target: str) -> List[str]:
+        build = get_build_name(fuzzer, target)
+        key = get_waiting_key(campaign_id, build)
+        with self._client.pipeline() as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            pipe.srem(get_campaign_key(campaign_id, "builds"), build)
+            pipelines, *_ = pipe.execute()
+        return pipelines
+
+    def built(self, campaign_id: str, fuzzer: str, target: str):
+        """Release the pipelines waiting for the built image into the rounds"""
+        pipelines = self._take_waiting(campaign_id, fuzzer, target)
+        if pipelines:
+            self._client.rpush(get_campaign_key(campaign_id, "pending"), *pipelines)
+
+    def build_failed(
+        self, campaign_id: str, fuzzer: str, target: str
+    ) -> Optional[List[str]]:
+        """
+        Fail the pipelines waiting for the image which can not be built
+
+        :return: see complete
+        """
+        pipelines = self._take_waiting(campaign_id, fuzzer, target)
+        if not pipelines:
+            return None
+        pipeline_ids = [str(uuid.uuid4()) for _ in pipelines]
+        for name in ("released", "done", "failed"):
+            self._client.sadd(get_campaign_key(campaign_id, name), *pipeline_ids)
+        return self._finish_if_done(campaign_id)
+
+    def _running(self, campaign_id: str) -> int:
+        released = self._client.scard(get_campaign_key(campaign_id, "released"))
+        done = self._client.scard(get_campaign_key(campaign_id, "done"))
+        return released - done
+
+    def inflight(self) -> int:
+        """Number of the released but not finished pipelines of all campaigns"""
+        return sum(
+            self._running(campaign_id)
+            for campaign_id in self._client.zrange(CAMPAIGNS_KEY, 0, -1)
+        )
+
+    def pending(self) -> int:
+        """Number of the not released pipelines of all campaigns"""
+        return sum(
+            self._client.llen(get_campaign_key(campaign_id, "pending"))
+            for campaign_id in self._client.zrange(CAMPAIGNS_KEY, 0, -1)
+        )
+
+    def next_round(self, capacity: int) -> List[Tuple[str, dict]]:
+        """
+        Take the pipelines for the free fuzzing slots, the caller has to hold
+        the lock and mark them as released
+
+        :param capacity: number of the free fuzzing slots
+        :return: campaign ids and the fuzz task kwargs
+        """
+        heap = []
+        for campaign_id, priority in self._client.zrange(
+            CAMPAIGNS_KEY, 0, -1, withscores=True
+        ):
+            weight = int(priority) + 1
+            running = self._running(campaign_id)
+            heap.append((running / weight, -priority, campaign_id, running, weight))
+        heapq.heapify(heap)
+        pipelines = []
+        while capacity > 0 and heap:
+            _, priority, campaign_id, running, weight = heapq.heappop(heap)
+            pipeline = self._client.lpop(get_campaign_key(campaign_id, "pending"))
+            if pipeline is None:
+                continue
+            pipelines.append((campaign_id, json.loads(pipeline)))
+            capacity -= 1
+            running += 1
+            heapq.heappush(
+                heap, (running / weight, priority, campaign_id, running, weight)
+            )
+        return pipelines
+
+    def release(self, campaign_id: str, pipeline_id: str):
+        self._client.sadd(get_campaign_key(campaign_id, "released"), pipeline_id)
+
+    def complete(
+        self, campaign_id: str, pipeline_id: str, failed: bool = False
+    ) -> Optional[List[str]]:
+        """
+        Mark the released pipeline as finished
+
+        :param campaign_id: campaign id
+        :param pipeline_id: pipeline id
+        :param failed: whether the pipeline is failed
+        :return: reused result prefixes if it is the last pipeline of the
+            campaign (returned exactly once), None otherwise
+        """
+        released = get_campaign_key(campaign_id, "released")
+        if not self._client.sismember(released, pipeline_id):
+            return None
+        self._client.sadd(get_campaign_key(campaign_id, "done"), pipeline_id)
+        if failed:
+            self._client.sadd(get_campaign_key(campaign_id, "failed"), pipeline_id)
+        return self._finish_if_done(campaign_id)
+
+    def _finish_if_done(self, campaign_id: str) -> Optional[List[str]]:
+        key = get_campaign_key(campaign_id)
+        total = int(self._client.hget(key, "total") or 0)
+        if self._client.scard(get_campaign_key(campaign_id, "done")) < total:
+            return None
+        if not self._client.hsetnx(key, "finished", 1):
+            return None
+        self._client.zrem(CAMPAIGNS_KEY, campaign_id)
+        for name in CAMPAIGN_KEYS:
+            self._client.expire(
+                get_campaign_key(campaign_id, name), config.CAMPAIGN_STATE_TTL
+            )
+        return json.loads(self._client.hget(key, "reused") or "[]")
+
+    def finish(self, campaign_id: str) -> Optional[List[str]]:
+        """Finish the campaign without pipelines, see complete"""
+        return self._finish_if_done(campaign_id)
+
+    def set_report_task(self, campaign_id: str, task_id: str):
+        self._client.hset(get_campaign_key(campaign_id), "report_task", task_id)
+
+    def progress(self, campaign_id: str) -> Optional[dict]:
+        meta = self._client.hgetall(get_campaign_key(campaign_id))
+        if not meta:
+            return None
+        released = self._client.scard(get_campaign_key(campaign_id, "released"))
+        done = self._client.scard(get_campaign_key(campaign_id, "done"))
+        return {
+            "priority": int(meta["priority"]),
+            "total": int(meta["total"]),
+            "pending": self._client.llen(get_campaign_key(campaign_id, "pending")),
+            "running": released - done,
+            "done": done,
+            "failed": self._client.scard(get_campaign_key(campaign_id, "failed")),
+            "building": sum(
+                self._client.llen(get_waiting_key(campaign_id, build))
+                for build in self._client.smembers(
+                    get_campaign_key(campaign_id, "builds")
+                )
+            ),
+            "finished": bool(meta.get("finished", False)),
+            "report_task": meta.get("report_task", None),
+        }
+
+
+def dispatcher_factory() -> Dispatcher:
+    client = redis.Redis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True
+    )
+    return Dispatcher(client)
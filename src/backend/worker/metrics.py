@@ -0,0 +1,229 @@
+import contextlib
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import BinaryIO, Dict, Iterator, Optional
+
+from backend import config
+
+logger = logging.getLogger("worker")
+NAMESPACE = "dmagma"
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+# counters named "{kind}_bytes" are exported as bytes, the rest as objects
+BYTES_SUFFIX = "_bytes"
+OBJECTS_SUFFIX = "_objects"
+
+
+class CountingReader:
+    """Readable stream wrapper counting the read bytes"""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.size = 0
+
+    def read(self, *args) -> bytes:
+        chunk = self._stream.read(*args)
+        self.size += len(chunk)
+        return chunk
+
+
+class TaskMetrics:
+    """
+    Structured measurements of the task: durations of its phases, exit codes
+    of the failed subprocesses, transferred bytes and object counts, time
+    spent in the queue. Attached to the task result and exported to Prometheus
+    by the worker (METRICS_PORT)
+    """
+
+    def __init__(self, task: str):
+        """
+        :param task: task name, label of the exported metrics
+        """
+        self.task = task
+        self.queue_wait: Optional[float] = None
+        self.phases: Dict[str, dict] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure the phase, the repeated phases are accumulated
+
+        :param name: phase name
+        """
+        status, exit_code = "ok", None
+        start = time.perf_counter()
+        try:
+            yield
+        except subprocess.CalledProcessError as e:
+            status, exit_code = "failed", e.returncode
+            raise
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                record = self.phases.setdefault(
+                    name, {"seconds": 0.0, "count": 0, "status": "ok"}
+                )
+                record["seconds"] += seconds
+                record["count"] += 1
+                if status != "ok":
+                    record["status"] = status
+                if exit_code is not None:
+                    record["exit_code"] = exit_code
+
+    def add(self, name: str, value: int = 1):
+        """
+        :param name: counter name, e.g. "uploaded_objects", "uploaded_bytes"
+        :param value: increment
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "task": self.task,
+                "queue_wait": self.queue_wait,
+                "phases": {name: dict(record) for name, record in self.phases.items()},
+                "counters": dict(self.counters),
+            }
+
+    def export(self):
+        """Record the measurements into the Prometheus metrics of the worker"""
+        if not is_exported():
+            return
+        metrics = get_prometheus_metrics()
+        measurements = self.as_dict()
+        if self.queue_wait is not None:
+            metrics.queue_wait.labels(self.task).observe(self.queue_wait)
+        for name, record in measurements["phases"].items():
+            metrics.phase.labels(self.task, name, record["status"]).observe(
+                record["seconds"]
+            )
+            if "exit_code" in record:
+                metrics.failures.labels(self.task, name, str(record["exit_code"])).inc()
+        for name, value in measurements["counters"].items():
+            if name.endswith(BYTES_SUFFIX):
+                metrics.bytes.labels(self.task, name[: -len(BYTES_SUFFIX)]).inc(value)
+            else:
+                kind = (
+                    name[: -len(OBJECTS_SUFFIX)]
+                    if name.endswith(OBJECTS_SUFFIX)
+                    else name
+                )
+                metrics.objects.labels(self.task, kind).inc(value)
+
+
+class NullMetrics(TaskMetrics):
+    """Disabled measurements (METRICS=0)"""
+
+    def __init__(self):
+        super().__init__("")
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+    def add(self, name: str, value: int = 1):
+        pass
+
+    def export(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def task_metrics(task: str, sent_at: float = None) -> Optional[TaskMetrics]:
+    """
+    :param task: task name
+    :param sent_at: timestamp of the task message, see the "sent_at" header
+    :return: measurements of the task, None if disabled
+    """
+    if not config.METRICS:
+        return None
+    metrics = TaskMetrics(task)
+    if sent_at:
+        metrics.queue_wait = max(0.0, time.time() - sent_at)
+    return metrics
+
+
+def is_exported() -> bool:
+    """Whether the worker exports the metrics, see start_exporter"""
+    return bool(config.METRICS_PORT) and MULTIPROC_DIR_ENV in os.environ
+
+
+@functools.lru_cache(maxsize=None)
+def get_prometheus_metrics() -> SimpleNamespace:
+    # imported on demand, the multiprocess mode of prometheus_client is selected
+    # by the environment on its first import, see start_exporter
+    from prometheus_client import Counter, Histogram
+
+    buckets = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+    return SimpleNamespace(
+        phase=Histogram(
+            f"{NAMESPACE}_task_phase_seconds",
+            "Duration of the task phase",
+            ["task", "phase", "status"],
+            buckets=buckets,
+        ),
+        queue_wait=Histogram(
+            f"{NAMESPACE}_task_queue_wait_seconds",
+            "Time of the task in the queue",
+            ["task"],
+            buckets=buckets,
+        ),
+        failures=Counter(
+            f"{NAMESPACE}_task_subprocess_failures",
+            "Failed subprocesses of the task phases",
+            ["task", "phase", "exit_code"],
+        ),
+        bytes=Counter(
+            f"{NAMESPACE}_task_bytes",
+            "Bytes packed and transferred by the tasks",
+            ["task", "kind"],
+        ),
+        objects=Counter(
+            f"{NAMESPACE}_task_objects",
+            "Objects transferred by the tasks",
+            ["task", "kind"],
+        ),
+    )
+
+
+def start_exporter(port: int = config.METRICS_PORT):
+    """
+    Serve the metrics of all the worker processes, has to be called by the
+    main worker process before the pool processes are forked
+
+    :param port: HTTP port of the metrics endpoint
+    """
+    path = config.METRICS_PATH / str(port)
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True, exist_ok=True)
+    # the multiprocess mode is selected on the import by the environment
+    os.environ[MULTIPROC_DIR_ENV] = str(path)
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+    logger.info(f"Metrics are exported on the port {port}")
+
+
+def mark_process_dead(pid: int):
+    if not is_exported():
+        return
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,102 @@
+import csv
+import logging
+import os
+import pathlib
+import threading
+from typing import Callable, Dict
+
+logger = logging.getLogger("worker")
+
+
+class MonitorTail:
+    """
+    Incremental reader of the captain monitor dumps: every poll interval captain
+    writes "<workdir>/monitor/<elapsed seconds>" with a single CSV row of the bug
+    counters "<BUG>_R" (reached) and "<BUG>_T" (triggered)
+    """
+
+    def __init__(self, workdir: pathlib.Path, offset: int = 0):
+        """
+        :param workdir: pipeline workdir
+        :param offset: seconds fuzzed before the run (resumed from a checkpoint)
+        """
+        self._monitor = workdir / "monitor"
+        self._offset = offset
+        self._elapsed = -1
+        self.reached: Dict[str, int] = {}
+        self.triggered: Dict[str, int] = {}
+
+    @property
+    def elapsed(self) -> int:
+        return self._offset + max(self._elapsed, 0)
+
+    def _parse(self, timestamp: int) -> bool:
+        with open(self._monitor / str(timestamp), newline="") as fd:
+            rows = list(csv.DictReader(fd))
+        if not rows:
+            return False
+        for column, value in rows[-1].items():
+            if not column or not value or not value.isdigit() or not int(value):
+                continue
+            bug, event = column[:-2], column[-2:]
+            events = self.reached if event == "_R" else self.triggered
+            events.setdefault(bug, self._offset + timestamp)
+        return True
+
+    def poll(self) -> bool:
+        """
+        Read the dumps written since the last poll
+
+        :return: whether new dumps have been read
+        """
+        try:
+            entries = os.scandir(self._monitor)
+        except FileNotFoundError:
+            return False
+        with entries:
+            timestamps = sorted(
+                int(entry.name)
+                for entry in entries
+                if entry.name.isdigit() and int(entry.name) > self._elapsed
+            )
+        updated = False
+        for timestamp in timestamps:
+            # the latest dump may be partially written, it is re-read next time
+            if not self._parse(timestamp):
+                break
+            self._elapsed = timestamp
+            updated = True
+        return updated
+
+    def progress(self) -> dict:
+        return {
+            "elapsed": self.elapsed,
+            "reached": len(self.reached),
+            "triggered": len(self.triggered),
+            "bugs": {"reached": self.reached, "triggered": self.triggered},
+        }
+
+
+class Poller:
+    """Background thread calling the callback every interval until stopped"""
+
+    def __init__(self, interval: float, callback: Callable[[], None]):
+        self._interval = interval
+        self._callback = callback
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._callback()
+            except Exception as e:
+                logger.warning(f"Poller callback failed: {e}")
+
+    def __enter__(self) -> "Poller":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
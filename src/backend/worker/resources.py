@@ -0,0 +1,111 @@
+import contextlib
+import fcntl
+import json
+import os
+import pathlib
+from typing import Iterator, List, Optional
+
+from backend import config
+
+
+def get_cores() -> List[int]:
+    cores = sorted(os.sched_getaffinity(0))
+    return cores[config.FUZZING_RESERVED_CORES :]
+
+
+def get_memory() -> int:
+    """
+    :return: total memory of the host in MiB
+    """
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024**2
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ResourceAllocator:
+    """
+    Host-local allocator of the pinned core sets and memory for the fuzzing
+    pipelines. Leases are shared by all worker processes of the host through
+    the locked file and are dropped automatically if the owner process is dead
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path = config.RESOURCES_PATH,
+        cores: List[int] = None,
+        memory: int = None,
+    ):
+        self._path = path
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._cores = cores if cores is not None else get_cores()
+        self._memory = memory if memory is not None else get_memory()
+
+    @contextlib.contextmanager
+    def _leases(self) -> Iterator[dict]:
+        with open(self._path, "a+") as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                fd.seek(0)
+                content = fd.read()
+                leases = json.loads(content) if content else {}
+                leases = {
+                    lease_id: lease
+                    for lease_id, lease in leases.items()
+                    if is_alive(lease["pid"])
+                }
+                yield leases
+                fd.seek(0)
+                fd.truncate()
+                json.dump(leases, fd)
+                fd.flush()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def fits(self, cores: int, memory: int = None) -> bool:
+        """Whether the request fits the host at all"""
+        return cores <= len(self._cores) and (memory or 0) <= self._memory
+
+    def acquire(
+        self, lease_id: str, cores: int, memory: int = None
+    ) -> Optional[List[int]]:
+        """
+        :param lease_id: lease owner id (pipeline id)
+        :param cores: number of the cores
+        :param memory: memory in MiB
+        :return: pinned cores or None if the host has not enough free resources
+        """
+        with self._leases() as leases:
+            if lease_id in leases:
+                return leases[lease_id]["cores"]
+            busy = {core for lease in leases.values() for core in lease["cores"]}
+            used_memory = sum(lease["memory"] for lease in leases.values())
+            free = [core for core in self._cores if core not in busy]
+            if len(free) < cores or used_memory + (memory or 0) > self._memory:
+                return None
+            leases[lease_id] = {
+                "pid": os.getpid(),
+                "cores": free[:cores],
+                "memory": memory or 0,
+            }
+            return leases[lease_id]["cores"]
+
+    def release(self, lease_id: str):
+        with self._leases() as leases:
+            leases.pop(lease_id, None)
+
+    def state(self) -> dict:
+        """Host resources and the active leases"""
+        with self._leases() as leases:
+            return {"cores": self._cores, "memory": self._memory, "leases": leases}
+
+
+def get_affinity(cores: List[int]) -> str:
+    return ",".join(str(core) for core in cores)
@@ -0,0 +1,124 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterator, Optional
+
+from backend import config
+from backend.worker.utils import link_tree
+
+
+def get_tree_size(path: pathlib.Path) -> int:
+    return sum(
+        (pathlib.Path(root) / file).stat().st_size
+        for root, _, files in os.walk(path)
+        for file in files
+    )
+
+
+class ResultCache:
+    """
+    Local LRU cache of the fetched result objects, shared by the worker
+    processes of the host. An entry is the folder materialized from the object
+    (downloaded file, extracted monitor dumps) keyed by the object name and its
+    etag, it is hard linked into the reduce workdir instead of being copied
+    """
+
+    def __init__(self, path: pathlib.Path, max_size: int):
+        """
+        :param path: cache folder
+        :param max_size: maximum size of the entries in bytes
+        """
+        self._path = path
+        self._entries = path / "entries"
+        self._tmp = path / "tmp"
+        self._max_size = max_size
+        self._entries.mkdir(parents=True, exist_ok=True)
+        self._tmp.mkdir(parents=True, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[Dict[str, int]]:
+        """Exclusive access to the entries, yields the entry sizes index"""
+        with open(self._path / "index.json", "a+") as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                fd.seek(0)
+                content = fd.read()
+                index = json.loads(content) if content else {}
+                yield index
+                fd.seek(0)
+                fd.truncate()
+                json.dump(index, fd)
+                fd.flush()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _entry(self, key: str, etag: str) -> pathlib.Path:
+        return self._entries / hashlib.sha256(f"{key}\0{etag}".encode()).hexdigest()
+
+    def _evict(self, index: Dict[str, int]):
+        size = sum(index.values())
+        if size <= self._max_size:
+            return
+        mtimes = {}
+        for name in list(index):
+            try:
+                mtimes[name] = (self._entries / name).stat().st_mtime_ns
+            except FileNotFoundError:
+                # removed behind the index, e.g. by a manual cleanup
+                size -= index.pop(name)
+        for name in sorted(mtimes, key=mtimes.get):
+            if size <= self._max_size:
+                break
+            shutil.rmtree(self._entries / name, ignore_errors=True)
+            size -= index.pop(name)
+
+    def fetch(
+        self,
+        key: str,
+        etag: str,
+        dst: pathlib.Path,
+        materialize: Callable[[pathlib.Path], None],
+    ) -> bool:
+        """
+        Link the cached entry of the object into the destination folder
+
+        :param key: object name
+        :param etag: object etag
+        :param dst: destination folder, created if does not exist
+        :param materialize: fills the given folder from the object on a miss
+        :return: whether the entry was cached
+        """
+        entry = self._entry(key, etag)
+        with self._lock() as index:
+            if entry.name in index and entry.exists():
+                os.utime(entry)
+                link_tree(entry, dst)
+                return True
+        # the object is fetched without the lock, a concurrent miss of the same
+        # object just fetches it twice
+        tmp = pathlib.Path(tempfile.mkdtemp(dir=self._tmp))
+        try:
+            materialize(tmp)
+            size = get_tree_size(tmp)
+            with self._lock() as index:
+                if entry.name not in index or not entry.exists():
+                    shutil.rmtree(entry, ignore_errors=True)
+                    os.rename(tmp, entry)
+                    index[entry.name] = size
+                os.utime(entry)
+                link_tree(entry, dst)
+                self._evict(index)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return False
+
+
+def result_cache_factory() -> Optional[ResultCache]:
+    if not config.RESULT_CACHE_SIZE:
+        return None
+    return ResultCache(config.RESULT_CACHE_PATH, config.RESULT_CACHE_SIZE)
@@ -1,11 +1,39 @@
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
+import json
+import shutil
 import subprocess
 import logging
+import os
 import pathlib
 import tempfile
-from typing import Tuple
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
 
 from backend import config, exceptions
-from backend.worker.utils import cleanup_folder, is_docker, remove_prefix
+from backend.worker.build_cache import BuildCache
+from backend.worker.checkpoint import Checkpointer, merge_monitor, shift_monitor
+from backend.worker.dataset import write_dataset
+from backend.worker.metrics import NULL_METRICS, CountingReader, TaskMetrics
+from backend.worker.monitor import MonitorTail, Poller
+from backend.worker.result_cache import ResultCache
+from backend.worker.sync import (
+    MANIFEST_NAME,
+    WorkdirSync,
+    fetch_files,
+    get_manifest,
+    put_manifest,
+)
+from backend.worker.utils import (
+    cleanup_folder,
+    is_docker,
+    merge_dicts,
+    parse_duration,
+)
 from backend.storage import Storage
 
 LOGGING_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
@@ -14,6 +42,19 @@ logger = logging.getLogger("worker")
 CAPTAIN_PATH = config.MAGMA_PATH / "tools/captain"
 BENCHD_PATH = config.MAGMA_PATH / "tools/benchd"
 REPORT_DF_PATH = config.MAGMA_PATH / "tools/report_df"
+SUMMARY_NAME = "summary.json"
+INDEX_PREFIX = "_index"
+OUTPUT_TAIL_LINES = 100
+OUTPUT_LINE_LIMIT = 64 * 1024
+CODECS = {
+    "tar": ("ball.tar", None),
+    "gz": ("ball.tar.gz", "gzip -{level}"),
+    "zst": ("ball.tar.zst", "zstd -{level} -T0"),
+}
+DEFAULT_LEVELS = {"gz": 6, "zst": 3}
+ARCHIVES = {name: codec for codec, (name, _) in CODECS.items()}
+# depth of the shard folders in the "ar/{fuzzer}/{target}/{program}/{run}" layout
+REPORT_SHARD_LEVELS = {"fuzzer": 1, "target": 2}
 
 
 class WorkerException(exceptions.BackendException):
@@ -24,24 +65,153 @@ def get_image_name(fuzzer: str, target: str) -> str:
     return f"magma/{fuzzer}/{target}"
 
 
-def shell_wrapper(cmd: str, cwd: pathlib.Path = None, comment: str = None) -> str:
+def shell_wrapper(
+    cmd: str,
+    cwd: pathlib.Path = None,
+    comment: str = None,
+    on_line: Callable[[str], None] = None,
+    tail_lines: int = OUTPUT_TAIL_LINES,
+) -> str:
+    """
+    Run the shell command forwarding its output line by line to the logger
+
+    :param cmd: shell command
+    :param cwd: working directory
+    :param comment: message logged before the execution
+    :param on_line: optional callback of every output line
+    :param tail_lines: number of the last output lines kept
+    :raise subprocess.CalledProcessError: with the output tail on the failure
+    :return: output tail (stdout and stderr)
+    """
     if comment:
         logger.info(comment)
     logger.debug(cmd)
+    tail = deque(maxlen=tail_lines)
+    with subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+    ) as proc:
+        for line in iter(lambda: proc.stdout.readline(OUTPUT_LINE_LIMIT), ""):
+            line = line.rstrip("\n")
+            logger.debug(line)
+            tail.append(line)
+            if on_line:
+                on_line(line)
+    output = "\n".join(tail)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=output)
+    return output
+
+
+def get_image_id(image: str) -> Optional[str]:
     result = subprocess.run(
-        cmd, cwd=cwd, capture_output=True, shell=True, text=True, check=True
+        f'docker image inspect --format "{{{{.Id}}}}" "{image}"',
+        capture_output=True,
+        shell=True,
+        text=True,
     )
-    logger.debug(result.stdout)
-    return str(result.stdout)
+    if result.returncode:
+        return None
+    return result.stdout.strip()
+
 
+def get_registry_image_name(image: str, digest: str) -> str:
+    return f"{config.BUILD_CACHE_REGISTRY}/{image}:{digest}"
 
-def build(fuzzer: str, target: str):
+
+def _build(fuzzer: str, target: str):
     cmd = f"FUZZER={fuzzer} TARGET={target} ./build.sh"
     shell_wrapper(
         cmd, CAPTAIN_PATH, f'Building "{get_image_name(fuzzer, target)}" image...'
     )
 
 
+def _pull(image: str, remote_image: str) -> bool:
+    try:
+        shell_wrapper(f'docker pull "{remote_image}"', comment=f"Pulling {image}...")
+        shell_wrapper(f'docker tag "{remote_image}" "{image}"')
+    except subprocess.CalledProcessError as e:
+        logger.warning(f'Unable to pull "{remote_image}": {e}')
+        return False
+    return True
+
+
+def _push(image: str, remote_image: str):
+    shell_wrapper(f'docker tag "{image}" "{remote_image}"')
+    shell_wrapper(f'docker push "{remote_image}"', comment=f"Pushing {image}...")
+
+
+def _is_cached(cache: BuildCache, fuzzer: str, target: str, digest: str) -> bool:
+    record = cache.get(fuzzer, target)
+    image_id = get_image_id(get_image_name(fuzzer, target))
+    return bool(
+        record and record["digest"] == digest and record["image_id"] == image_id
+    )
+
+
+def pull(fuzzer: str, target: str, cache: BuildCache = None):
+    """
+    Get the fuzzer/target image prebuilt by the build stage: it is pulled from the
+    registry of the build cache or taken from the docker daemon shared with the
+    build worker (and its build cache). The image is built locally if it can not
+    be obtained or the local image is not the one built from the current inputs,
+    e.g. on the separate fuzzing hosts without BUILD_CACHE_REGISTRY
+
+    :param fuzzer: fuzzer name
+    :param target: target name
+    :param cache: build cache
+    """
+    image = get_image_name(fuzzer, target)
+    if cache:
+        with cache.lock(fuzzer, target):
+            digest = cache.digest(fuzzer, target)
+            if _is_cached(cache, fuzzer, target, digest):
+                return
+            remote_image = cache.get_shared(fuzzer, target, digest)
+            if remote_image and _pull(image, remote_image):
+                cache.put(fuzzer, target, digest, get_image_id(image))
+                return
+        # a local image of the other inputs would be fuzzed silently otherwise
+        logger.warning(f'Prebuilt image "{image}" is missing or stale, building it')
+        build(fuzzer, target, cache)
+    elif get_image_id(image) is None:
+        logger.warning(f'Prebuilt image "{image}" is not available, building it')
+        build(fuzzer, target)
+
+
+def build(fuzzer: str, target: str, cache: BuildCache = None):
+    """
+    Build the fuzzer/target image, skipping the build if the cache already has
+    an image of the same inputs
+
+    :param fuzzer: fuzzer name
+    :param target: target name
+    :param cache: build cache, the image is built unconditionally if not defined
+    """
+    if not cache:
+        _build(fuzzer, target)
+        return
+    image = get_image_name(fuzzer, target)
+    with cache.lock(fuzzer, target):
+        digest = cache.digest(fuzzer, target)
+        if _is_cached(cache, fuzzer, target, digest):
+            logger.info(f'"{image}" is up to date, skipping build')
+            return
+        remote_image = cache.get_shared(fuzzer, target, digest)
+        if not (remote_image and _pull(image, remote_image)):
+            _build(fuzzer, target)
+            if cache.storage and config.BUILD_CACHE_REGISTRY:
+                remote_image = get_registry_image_name(image, digest)
+                _push(image, remote_image)
+                cache.put_shared(fuzzer, target, digest, remote_image)
+        cache.put(fuzzer, target, digest, get_image_id(image))
+
+
 def get_workdir_and_shared(
     pipeline_id: str,
     tmp_workdir: pathlib.Path = None,
@@ -67,19 +237,166 @@ def start(
     shared: str,
     poll: int,
     timeout: str,
+    on_line: Callable[[str], None] = None,
+    affinity: str = None,
 ):
     cmd = f"PIPELINE_ID={pipeline_id} FUZZER={fuzzer} TARGET={target} \
         PROGRAM={program} SHARED={shared} POLL={poll} TIMEOUT={timeout} ./start.sh"
-    shell_wrapper(cmd, CAPTAIN_PATH, "Fuzzing has been started...")
+    if affinity:
+        cmd = f"AFFINITY={affinity} {cmd}"
+    shell_wrapper(cmd, CAPTAIN_PATH, "Fuzzing has been started...", on_line)
+
+
+def get_archive_name(codec: str) -> str:
+    if codec not in CODECS:
+        raise WorkerException(f'Unsupported archive codec "{codec}"')
+    return CODECS[codec][0]
+
 
+def get_compress_program(codec: str, level: int = None) -> Optional[str]:
+    get_archive_name(codec)
+    program = CODECS[codec][1]
+    if program:
+        level = level if level is not None else DEFAULT_LEVELS[codec]
+        program = program.format(level=level)
+    return program
 
-def pack(workdir: pathlib.Path, out_dir: pathlib.Path) -> pathlib.Path:
+
+@contextlib.contextmanager
+def pack_stream(
+    workdir: pathlib.Path,
+    codec: str = config.PACK_CODEC,
+    level: int = config.PACK_LEVEL,
+) -> Iterator[BinaryIO]:
+    """
+    Archive the workdir on the fly without an intermediate file
+
+    :param workdir: local worker path with results of the fuzzing container
+    :param codec: one of the CODECS
+    :param level: compression level, codec default if not defined
+    :return: readable stream of the archive
+    """
     if not len(list(workdir.iterdir())):
         raise WorkerException("Workdir is empty, nothing to gather")
-    archive = out_dir / "ball.tar"
-    cmd = f'tar -cf "{archive.absolute()}" -C "{workdir.absolute()}" .'
-    shell_wrapper(cmd, comment="Packing...")
-    return archive
+    cmd = ["tar", "-cf", "-", "-C", str(workdir.absolute())]
+    program = get_compress_program(codec, level)
+    if program:
+        cmd.extend(["--use-compress-program", program])
+    cmd.append(".")
+    logger.info("Packing...")
+    logger.debug(" ".join(cmd))
+    with tempfile.TemporaryFile() as stderr:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as proc:
+            try:
+                yield proc.stdout
+            except BaseException:
+                proc.kill()
+                raise
+        if proc.returncode:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                proc.returncode, cmd, stderr=stderr.read()
+            )
+
+
+def generate_report(workdir: pathlib.Path, report: pathlib.Path, comment: str = None):
+    cmd = f'python {BENCHD_PATH / "exp2json.py"} {workdir.resolve()} {report.resolve()}'
+    shell_wrapper(cmd, comment=comment)
+
+
+def get_report_shards(ar: pathlib.Path, shard_by: str) -> List[pathlib.Path]:
+    """
+    :param ar: "ar" folder of the exp2json.py workdir
+    :param shard_by: "fuzzer" or "target"
+    :return: shard folders relative to the "ar"
+    """
+    if shard_by not in REPORT_SHARD_LEVELS:
+        raise WorkerException(f'Unknown report shard level "{shard_by}"')
+    shards = [pathlib.Path()]
+    for _ in range(REPORT_SHARD_LEVELS[shard_by]):
+        shards = sorted(
+            shard / entry.name for shard in shards for entry in (ar / shard).iterdir()
+        )
+    return shards
+
+
+def merge_reports(reports: Iterable[pathlib.Path]) -> dict:
+    result = {"results": {}}
+    for report in reports:
+        with open(report) as fd:
+            merge_dicts(result, json.load(fd))
+    return result
+
+
+def generate_sharded_report(
+    workdir: pathlib.Path,
+    report: pathlib.Path,
+    shard_by: str = config.REPORT_SHARD_BY,
+    concurrency: int = config.REPORT_CONCURRENCY,
+):
+    """
+    Run exp2json.py per fuzzer or per fuzzer/target in parallel processes and
+    merge their reports into the single report of the workdir
+
+    :param workdir: exp2json.py workdir with the "ar" folder
+    :param report: path of the merged report
+    :param shard_by: "fuzzer" or "target"
+    :param concurrency: maximum number of the exp2json.py processes, 0 for the
+        number of the CPUs
+    """
+    ar = workdir / "ar"
+    shards = get_report_shards(ar, shard_by)
+    if len(shards) <= 1:
+        generate_report(workdir, report, "Generating JSON report...")
+        return
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        reports = []
+        for i, shard in enumerate(shards):
+            # runs are linked as summarize does, the rest of the layout is real
+            for run in (ar / shard).glob("/".join("*" * (4 - len(shard.parts)))):
+                link = tmp_dir / str(i) / "ar" / run.relative_to(ar)
+                link.parent.mkdir(parents=True, exist_ok=True)
+                link.symlink_to(run.absolute(), target_is_directory=True)
+            reports.append(tmp_dir / f"{i}.json")
+        logger.info(f"Generating JSON report in {len(shards)} shards...")
+        with ThreadPoolExecutor(max_workers=concurrency or os.cpu_count()) as executor:
+            futures = [
+                executor.submit(generate_report, tmp_dir / str(i), shard_report)
+                for i, shard_report in enumerate(reports)
+            ]
+            for future in futures:
+                future.result()
+        result = merge_reports(reports)
+    with open(report, "w") as fd:
+        json.dump(result, fd)
+
+
+def summarize(
+    pipeline_id: str,
+    fuzzer: str,
+    target: str,
+    program: str,
+    workdir: pathlib.Path,
+    out_dir: pathlib.Path,
+) -> pathlib.Path:
+    """
+    Generate the JSON report of the single pipeline
+
+    :param pipeline_id: fuzzing process id (run name in the report)
+    :param fuzzer: fuzzer name
+    :param target: target name
+    :param program: target program name
+    :param workdir: local worker path with results of the fuzzing container
+    :param out_dir: folder for the intermediate files and the summary
+    :return: pipeline summary path
+    """
+    run = out_dir / "workdir" / "ar" / fuzzer / target / program / pipeline_id
+    run.parent.mkdir(parents=True, exist_ok=True)
+    run.symlink_to(workdir.absolute(), target_is_directory=True)
+    summary = out_dir / SUMMARY_NAME
+    generate_report(out_dir / "workdir", summary, "Generating pipeline summary...")
+    return summary
 
 
 def run_fuzz_pipeline(
@@ -93,9 +410,19 @@ def run_fuzz_pipeline(
     poll: int,
     timeout: str,
     storage: Storage,
+    build_cache: BuildCache = None,
+    progress: Callable[[dict], None] = None,
+    affinity: str = None,
+    pipeline_key: str = None,
+    prebuilt: bool = False,
+    metrics: TaskMetrics = None,
 ):
     """
-    Perform fuzzing and save results to storage
+    Perform fuzzing and save results to storage. The workdir files are synced
+    to the storage in batches while fuzzing (WORKDIR_SYNC), so the results are
+    stored as the manifest of the synced files instead of the packed archive.
+    The workdir is checkpointed every CHECKPOINT_POLLS polls, so the
+    redelivered pipeline fuzzes only the remaining time
 
     :param campaign_id: benchmark campaign id
     :param pipeline_id: fuzzing process id (task id)
@@ -107,36 +434,367 @@ def run_fuzz_pipeline(
     :param poll: monitor poll delay
     :param timeout: fuzzing process timeout
     :param storage: storage for the fuzzing results
+    :param build_cache: cache of the built images
+    :param progress: callback of the monitor progress, called every poll interval
+    :param affinity: cpuset of the fuzzing container ("0,1,...")
+    :param pipeline_key: content key to index the results for the reuse
+    :param prebuilt: the image is built by the build stage, only pull it
+    :param metrics: measurements of the pipeline phases
     :return: object name of the results in the storage
     """
-    cleanup_folder(workdir)
-    build(fuzzer, target)
-    start(pipeline_id, fuzzer, target, program, shared, poll, timeout)
+    metrics = metrics or NULL_METRICS
+    cleanup_folder(workdir, background=bool(config.CLEANUP_IN_BACKGROUND))
+    # both the archive and the blobs are compressed by the codec
+    get_archive_name(config.PACK_CODEC)
+    sync = WorkdirSync(storage, campaign_id, workdir)
+    checkpointer = None
+    offset = 0
+    if config.CHECKPOINT_POLLS:
+        # the retried task (same pipeline id) resumes from the last checkpoint
+        checkpointer = Checkpointer(storage, campaign_id, pipeline_id, sync)
+        with metrics.phase("restore"):
+            offset = checkpointer.restore()
+    remaining = parse_duration(timeout) - offset
+    with metrics.phase("build"):
+        if prebuilt:
+            pull(fuzzer, target, build_cache)
+        else:
+            build(fuzzer, target, build_cache)
+    monitor = MonitorTail(workdir, offset)
+    polls = itertools.count(1)
+
+    def on_poll():
+        updated = monitor.poll()
+        if progress and updated:
+            progress(monitor.progress())
+        if config.WORKDIR_SYNC:
+            with metrics.phase("sync"):
+                sync.sync(config.SYNC_BATCH)
+        if checkpointer and next(polls) % config.CHECKPOINT_POLLS == 0:
+            with metrics.phase("checkpoint"):
+                checkpointer.save(monitor.elapsed)
+
     with tempfile.TemporaryDirectory(pipeline_id, campaign_id) as tmp_dir:
-        tar = pack(workdir, pathlib.Path(tmp_dir))
-        name = tar.name
-        path = f"{campaign_id}/{fuzzer}/{target}/{program}/{pipeline_id}/{name}"
-        storage.put(tar, path)
+        tmp_dir = pathlib.Path(tmp_dir)
+        restored = tmp_dir / "monitor"
+        if offset and (workdir / "monitor").exists():
+            # captain dumps of the resumed run start from zero again
+            shutil.move(workdir / "monitor", restored)
+        if remaining > 0:
+            with metrics.phase("fuzz"), Poller(poll, on_poll):
+                start(
+                    pipeline_id,
+                    fuzzer,
+                    target,
+                    program,
+                    shared,
+                    poll,
+                    f"{remaining}s" if offset else timeout,
+                    affinity=affinity,
+                )
+        if restored.exists():
+            if (workdir / "monitor").exists():
+                shift_monitor(workdir / "monitor", offset)
+            merge_monitor(restored, workdir / "monitor")
+        prefix = get_result_prefix(campaign_id, fuzzer, target, program, pipeline_id)
+        if config.WORKDIR_SYNC:
+            with metrics.phase("upload"):
+                # the merged monitor dumps are already named on the absolute time axis
+                sync.offset = 0
+                sync.sync(prune=True)
+                path = f"{prefix}/{MANIFEST_NAME}"
+                put_manifest(storage, sync.manifest(), path)
+        else:
+            path = f"{prefix}/{get_archive_name(config.PACK_CODEC)}"
+            with metrics.phase("pack"), pack_stream(workdir) as archive:
+                archive = CountingReader(archive)
+                storage.put_stream(archive, path)
+            metrics.add("packed_bytes", archive.size)
+            metrics.add("uploaded_objects")
+            metrics.add("uploaded_bytes", archive.size)
+        metrics.add("uploaded_objects", sync.uploaded_objects)
+        metrics.add("uploaded_bytes", sync.uploaded_bytes)
+        with metrics.phase("summarize"):
+            summary = summarize(pipeline_id, fuzzer, target, program, workdir, tmp_dir)
+            storage.put(summary, f"{prefix}/{SUMMARY_NAME}")
+        metrics.add("uploaded_objects")
+        metrics.add("uploaded_bytes", summary.stat().st_size)
+        if pipeline_key:
+            index_result(storage, pipeline_key, prefix)
+        if checkpointer:
+            checkpointer.delete()
         return path
 
 
+@functools.lru_cache(maxsize=None)
+def get_magma_revision() -> Optional[str]:
+    if config.MAGMA_REVISION:
+        return config.MAGMA_REVISION
+    result = subprocess.run(
+        ["git", "-C", str(config.MAGMA_PATH), "rev-parse", "HEAD"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        logger.warning("Unable to determine the Magma revision")
+        return None
+    return result.stdout.strip()
+
+
+def get_pipeline_key(
+    fuzzer: str,
+    target: str,
+    program: str,
+    args: Optional[str],
+    timeout: str,
+    revision: str,
+) -> str:
+    """
+    :return: content key of the pipeline, equal for the identical runs
+    """
+    content = json.dumps([fuzzer, target, program, args, timeout, revision])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_result_prefix(
+    campaign_id: str, fuzzer: str, target: str, program: str, pipeline_id: str
+) -> str:
+    return f"{campaign_id}/{fuzzer}/{target}/{program}/{pipeline_id}"
+
+
+def index_result(storage: Storage, pipeline_key: str, result_prefix: str):
+    """
+    Register the pipeline results in the index of the storage
+
+    :param storage: storage of the fuzzing results
+    :param pipeline_key: pipeline content key
+    :param result_prefix: prefix of the pipeline results
+    """
+    campaign_id = result_prefix.split("/", 1)[0]
+    pipeline_id = result_prefix.rsplit("/", 1)[1]
+    key = f"{INDEX_PREFIX}/{pipeline_key}/{campaign_id}/{pipeline_id}"
+    storage.put_stream(io.BytesIO(result_prefix.encode()), key)
+
+
+def delete_index(storage: Storage, campaign_id: str):
+    """
+    Remove the index entries of the campaign results
+
+    :param storage: storage of the fuzzing results
+    :param campaign_id: fuzzing campaign id
+    """
+    # "_index/{pipeline_key}/{campaign_id}/{pipeline_id}"
+    for key in storage.list(prefix=f"{INDEX_PREFIX}/"):
+        if key.split("/")[2:3] == [campaign_id]:
+            storage.delete(key)
+
+
+def is_result(storage: Storage, result_prefix: str) -> bool:
+    """
+    :param storage: storage of the fuzzing results
+    :param result_prefix: prefix of the pipeline results
+    :return: whether the results archive or the manifest is still stored
+    """
+    for key in storage.list(prefix=f"{result_prefix}/"):
+        name = key.rsplit("/", 1)[1]
+        if name in ARCHIVES or name == MANIFEST_NAME:
+            return True
+    return False
+
+
+def find_results(storage: Storage, pipeline_key: str) -> List[str]:
+    """
+    :param storage: storage of the fuzzing results
+    :param pipeline_key: pipeline content key
+    :return: result prefixes of the indexed identical pipelines, the stale
+        entries of the deleted results are dropped
+    """
+    prefixes = []
+    for key in storage.list(prefix=f"{INDEX_PREFIX}/{pipeline_key}/"):
+        stream = storage.get_stream(key)
+        try:
+            prefix = stream.read().decode()
+        finally:
+            stream.close()
+        if is_result(storage, prefix):
+            prefixes.append(prefix)
+        else:
+            logger.info(f'Dropping the stale index entry "{key}"')
+            storage.delete(key)
+    return prefixes
+
+
 def get_report_key(campaign_id: str) -> str:
     return f"{campaign_id}.json"
 
 
-def reduce(campaign_id, fuzz_storage: Storage, reports_storage: Storage):
+def unpack_monitor(stream: BinaryIO, out_dir: pathlib.Path, codec: str = "tar"):
+    """
+    Extract the monitor dumps of the results archive while it is being read,
+    the same members are extracted by exp2json.py from the "ball.tar"
+
+    :param stream: readable results archive
+    :param out_dir: pipeline folder of the reduce workdir
+    :param codec: one of the CODECS
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cmd = ["tar", "-xf", "-", "-C", str(out_dir.absolute())]
+    program = get_compress_program(codec)
+    if program:
+        cmd.extend(["--use-compress-program", program])
+    cmd.append("./monitor")
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        try:
+            shutil.copyfileobj(stream, proc.stdin)
+        except BrokenPipeError:
+            pass
+        finally:
+            proc.stdin.close()
+        stderr = proc.stderr.read()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+def fetch_result(
+    key: str,
+    out_dir: pathlib.Path,
+    storage: Storage,
+    etag: str = None,
+    cache: ResultCache = None,
+    metrics: TaskMetrics = NULL_METRICS,
+) -> pathlib.Path:
+    # "{campaign_id}/{fuzzer}/{target}/{program}/{pipeline_id}/{name}"
+    result_path = out_dir / key.split("/", 1)[1]
+
+    def materialize(folder: pathlib.Path):
+        if result_path.name in ARCHIVES:
+            stream = storage.get_stream(key)
+            try:
+                unpack_monitor(stream, folder, ARCHIVES[result_path.name])
+            finally:
+                stream.close()
+        elif result_path.name == MANIFEST_NAME:
+            manifest = get_manifest(storage, key)
+            fetch_files(storage, manifest, folder, folder="monitor")
+        else:
+            folder.mkdir(parents=True, exist_ok=True)
+            storage.get(key, folder / result_path.name)
+
+    if cache and etag:
+        if cache.fetch(key, etag, result_path.parent, materialize):
+            metrics.add("cache_hits")
+    else:
+        materialize(result_path.parent)
+    return result_path
+
+
+def fetch_results(
+    prefixes: List[str],
+    ar: pathlib.Path,
+    summaries_dir: pathlib.Path,
+    storage: Storage,
+    concurrency: int = config.REDUCE_CONCURRENCY,
+    cache: ResultCache = None,
+    metrics: TaskMetrics = NULL_METRICS,
+) -> List[pathlib.Path]:
+    """
+    Download the campaign results. Pipelines with a summary are represented only
+    by it, the rest are downloaded into the exp2json.py "ar" layout
+
+    :param prefixes: campaign or pipeline prefixes of the results
+    :param ar: "ar" folder of the reduce workdir
+    :param summaries_dir: folder for the pipeline summaries
+    :param storage: storage of the fuzzing results
+    :param concurrency: maximum number of the simultaneous downloads
+    :param cache: local cache of the fetched results
+    :param metrics: measurements of the fetched objects
+    :return: downloaded pipeline summaries
+    """
+    pipelines = defaultdict(list)
+    for prefix in prefixes:
+        for obj in storage.scan(prefix=f"{prefix}/"):
+            pipelines[obj.key.rsplit("/", 1)[0]].append(obj)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        summaries, archives = [], []
+        for objects in pipelines.values():
+            summary = [obj for obj in objects if obj.key.endswith(f"/{SUMMARY_NAME}")]
+            if summary:
+                objects, out_dir, futures = summary, summaries_dir, summaries
+            else:
+                out_dir, futures = ar, archives
+            for obj in objects:
+                metrics.add("fetched_objects")
+                metrics.add("fetched_bytes", obj.size)
+                futures.append(
+                    executor.submit(
+                        fetch_result,
+                        obj.key,
+                        out_dir,
+                        storage,
+                        obj.etag,
+                        cache,
+                        metrics,
+                    )
+                )
+        for future in archives:
+            future.result()
+        return [future.result() for future in summaries]
+
+
+def reduce(
+    campaign_id,
+    fuzz_storage: Storage,
+    reports_storage: Storage,
+    reused: List[str] = None,
+    concurrency: int = config.REDUCE_CONCURRENCY,
+    cache: ResultCache = None,
+    metrics: TaskMetrics = None,
+):
+    """
+    Merge the pipeline summaries of the campaign into the single report, the
+    pipelines without summary are processed by exp2json.py. Fetched results are
+    linked from the local cache, so the repeated reduce downloads only changes.
+    The report is also stored as the Parquet dataset of the campaigns (DATASET)
+
+    :param campaign_id: benchmark campaign id
+    :param fuzz_storage: storage of the fuzzing results
+    :param reports_storage: storage for the report
+    :param reused: result prefixes of the previous campaigns pipelines
+    :param concurrency: maximum number of the simultaneous downloads
+    :param cache: local cache of the fetched results
+    :param metrics: measurements of the reduce phases
+    """
+    metrics = metrics or NULL_METRICS
     with tempfile.TemporaryDirectory(prefix=campaign_id) as tmp_dir:
         tmp_dir = pathlib.Path(tmp_dir)
         workdir = tmp_dir / "workdir"
         ar = workdir / "ar"
         ar.mkdir(parents=True, exist_ok=True)
-        for key in fuzz_storage.list(prefix=campaign_id):
-            result_path = ar / remove_prefix(key, campaign_id).strip("/")
-            result_path.parent.mkdir(parents=True, exist_ok=True)
-            fuzz_storage.get(key, result_path)
+        logger.info("Downloading fuzzing results...")
+        with metrics.phase("fetch"):
+            summaries = fetch_results(
+                [campaign_id, *(reused or [])],
+                ar,
+                tmp_dir / "summaries",
+                fuzz_storage,
+                concurrency,
+                cache,
+                metrics,
+            )
         report = tmp_dir / "report.json"
-        workdir_p = workdir.resolve()
-        report_p = report.resolve()
-        cmd = f'python {BENCHD_PATH / "exp2json.py"} {workdir_p} {report_p}'
-        shell_wrapper(cmd, comment="Generating JSON report...")
-        reports_storage.put(report, get_report_key(campaign_id))
+        with metrics.phase("report"):
+            result = merge_reports(summaries)
+            if any(ar.iterdir()):
+                generate_sharded_report(workdir, report)
+                with open(report) as fd:
+                    merge_dicts(result, json.load(fd))
+            with open(report, "w") as fd:
+                json.dump(result, fd)
+        with metrics.phase("upload"):
+            reports_storage.put(report, get_report_key(campaign_id))
+        metrics.add("uploaded_objects")
+        metrics.add("uploaded_bytes", report.stat().st_size)
+        if config.DATASET:
+            with metrics.phase("dataset"):
+                keys = write_dataset(reports_storage, campaign_id, result, tmp_dir)
+            metrics.add("uploaded_objects", len(keys))
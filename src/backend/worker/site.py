@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import math
+import mimetypes
+import os
+import pathlib
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import billiard
+import jinja2
+
+from backend import config
+from backend.storage import NotFoundException, Storage
+from backend.worker.dataset import flatten_report
+from backend.worker.metrics import NULL_METRICS, TaskMetrics
+from backend.worker.service import get_report_key
+from backend.worker.sync import get_manifest, put_manifest
+
+logger = logging.getLogger("worker")
+SITE_PREFIX = "_site"
+MANIFEST_NAME = "manifest.json"
+# has to be bumped on the changes of the plots or the templates, so the
+# already published sites are rendered again
+SITE_VERSION = "1"
+TEMPLATES_PATH = pathlib.Path(__file__).parent / "templates" / "site"
+Slice = Tuple[str, str]
+
+
+def get_site_prefix(campaign_id: str) -> str:
+    return f"{SITE_PREFIX}/{campaign_id}"
+
+
+def get_slices(report: dict) -> Dict[Slice, dict]:
+    """
+    :param report: campaign report, see exp2json.py
+    :return: programs results of every fuzzer/target
+    """
+    return {
+        (fuzzer, target): programs
+        for fuzzer, targets in report["results"].items()
+        for target, programs in targets.items()
+    }
+
+
+def fingerprint(*inputs) -> str:
+    digest = hashlib.sha256(SITE_VERSION.encode())
+    for value in inputs:
+        digest.update(json.dumps(value, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def plot_slice(title: str, programs: dict, path: str):
+    """
+    Plot the mean number of the reached and triggered bugs per run over time
+
+    :param title: plot title
+    :param programs: runs of every program of the fuzzer/target
+    :param path: SVG file path
+    """
+    # imported by the pool processes only
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    for program, runs in sorted(programs.items()):
+        for event, style in (("reached", "--"), ("triggered", "-")):
+            times = [sorted(events.get(event, {}).values()) for events in runs.values()]
+            steps = sorted({time for run in times for time in run})
+            counts = [
+                sum(sum(1 for t in run if t <= time) for run in times) / len(runs)
+                for time in steps
+            ]
+            ax.step(
+                [0, *steps],
+                [0, *counts],
+                where="post",
+                linestyle=style,
+                label=f"{program} ({event})",
+            )
+    ax.set_title(title)
+    ax.set_xlabel("Time, s")
+    ax.set_ylabel("Bugs per run")
+    ax.legend(fontsize="small")
+    fig.savefig(path, format="svg", bbox_inches="tight")
+    plt.close(fig)
+
+
+def render_plots(plots: List[Tuple[str, dict, str]], concurrency: int):
+    """
+    :param plots: plot_slice arguments of every plot
+    :param concurrency: maximum number of the plotting processes, 0 for the
+        number of the CPUs
+    """
+    if len(plots) <= 1:
+        for args in plots:
+            plot_slice(*args)
+        return
+    # billiard processes could be started by the daemonic celery pool processes
+    processes = min(len(plots), concurrency or os.cpu_count())
+    with billiard.Pool(processes) as pool:
+        pool.starmap(plot_slice, plots)
+
+
+def format_seconds(value) -> str:
+    return "-" if value is None or math.isnan(value) else str(int(value))
+
+
+def get_bug_rows(campaign_id: str, fuzzer: str, target: str, programs: dict):
+    df = flatten_report(campaign_id, {"results": {fuzzer: {target: programs}}})
+    if df.empty:
+        return []
+    df = df.astype({"reached": "float", "triggered": "float"})
+    table = (
+        df.groupby(["program", "bug"])
+        .agg(
+            reached=("reached", "count"),
+            reached_median=("reached", "median"),
+            triggered=("triggered", "count"),
+            triggered_median=("triggered", "median"),
+        )
+        .reset_index()
+    )
+    return [
+        {
+            **row,
+            "runs": len(programs[row["program"]]),
+            "reached_median": format_seconds(row["reached_median"]),
+            "triggered_median": format_seconds(row["triggered_median"]),
+        }
+        for row in table.to_dict("records")
+    ]
+
+
+def get_slice_row(fuzzer: str, target: str, programs: dict) -> dict:
+    runs = [events for runs in programs.values() for events in runs.values()]
+    return {
+        "fuzzer": fuzzer,
+        "target": target,
+        "page": f"{fuzzer}/{target}.html",
+        "programs": len(programs),
+        "runs": len(runs),
+        "reached": len({bug for run in runs for bug in run.get("reached", {})}),
+        "triggered": len({bug for run in runs for bug in run.get("triggered", {})}),
+    }
+
+
+def render_site(
+    campaign_id: str,
+    storage: Storage,
+    concurrency: int = config.REPORT_CONCURRENCY,
+    metrics: Optional[TaskMetrics] = None,
+) -> dict:
+    """
+    Render the static HTML site of the campaign report into the storage
+    ("_site/{campaign_id}/index.html"). Every fuzzer/target slice of the report
+    is fingerprinted, only the plots and the pages of the changed slices are
+    rendered again, e.g. when the campaign is extended by the new runs
+
+    :param campaign_id: campaign id
+    :param storage: storage of the report and the site
+    :param concurrency: maximum number of the plotting processes
+    :param metrics: measurements of the rendering phases
+    :return: numbers of the rendered and the skipped slices
+    """
+    metrics = metrics or NULL_METRICS
+    prefix = get_site_prefix(campaign_id)
+    manifest_key = f"{prefix}/{MANIFEST_NAME}"
+    report = get_manifest(storage, get_report_key(campaign_id))
+    try:
+        manifest = get_manifest(storage, manifest_key)
+    except NotFoundException:
+        manifest = {}
+    rendered = manifest.get("slices", {})
+    slices = get_slices(report)
+    fingerprints = {
+        f"{fuzzer}/{target}": fingerprint(campaign_id, programs)
+        for (fuzzer, target), programs in slices.items()
+    }
+    changed = [
+        (fuzzer, target)
+        for fuzzer, target in slices
+        if rendered.get(f"{fuzzer}/{target}") != fingerprints[f"{fuzzer}/{target}"]
+    ]
+    index = fingerprint(campaign_id, fingerprints)
+    logger.info(f"Rendering {len(changed)} of {len(slices)} report slices...")
+    with tempfile.TemporaryDirectory(prefix=campaign_id) as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        for fuzzer, _ in changed:
+            (tmp_dir / fuzzer).mkdir(exist_ok=True)
+        with metrics.phase("plots"):
+            render_plots(
+                [
+                    (
+                        f"{fuzzer}/{target}",
+                        slices[fuzzer, target],
+                        str(tmp_dir / fuzzer / f"{target}.svg"),
+                    )
+                    for fuzzer, target in changed
+                ],
+                concurrency,
+            )
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(TEMPLATES_PATH), autoescape=True
+        )
+        with metrics.phase("pages"):
+            for fuzzer, target in changed:
+                page = env.get_template("slice.html").render(
+                    campaign_id=campaign_id,
+                    fuzzer=fuzzer,
+                    target=target,
+                    plot=f"{target}.svg",
+                    bugs=get_bug_rows(
+                        campaign_id, fuzzer, target, slices[fuzzer, target]
+                    ),
+                )
+                (tmp_dir / fuzzer / f"{target}.html").write_text(page)
+            if manifest.get("index") != index:
+                page = env.get_template("index.html").render(
+                    campaign_id=campaign_id,
+                    slices=[
+                        get_slice_row(fuzzer, target, programs)
+                        for (fuzzer, target), programs in sorted(slices.items())
+                    ],
+                )
+                (tmp_dir / "index.html").write_text(page)
+        with metrics.phase("upload"):
+            files = [path for path in tmp_dir.rglob("*") if path.is_file()]
+            for path in files:
+                # S3 serves the objects without the type as binary/octet-stream
+                storage.put(
+                    path,
+                    f"{prefix}/{path.relative_to(tmp_dir)}",
+                    content_type=mimetypes.guess_type(path.name)[0],
+                )
+            for name in set(rendered) - set(fingerprints):
+                storage.delete(f"{prefix}/{name}.html")
+                storage.delete(f"{prefix}/{name}.svg")
+            # the manifest is stored last, an interrupted rendering is repeated
+            put_manifest(
+                storage, {"slices": fingerprints, "index": index}, manifest_key
+            )
+        metrics.add("uploaded_objects", len(files))
+        metrics.add("uploaded_bytes", sum(path.stat().st_size for path in files))
+    return {"rendered": len(changed), "skipped": len(slices) - len(changed)}
@@ -0,0 +1,237 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+from typing import Dict, Optional, Set, Tuple
+
+from backend import config
+from backend.storage import Storage
+from backend.worker.metrics import CountingReader
+
+logger = logging.getLogger("worker")
+BLOBS_PREFIX = "_blobs"
+MANIFEST_NAME = "manifest.json"
+MONITOR_DIR = "monitor"
+HASH_CHUNK_SIZE = 1024**2
+# compression programs of the blobs per PACK_CODEC, "tar" blobs are stored as is
+BLOB_PROGRAMS = {"tar": None, "gz": "gzip", "zst": "zstd"}
+
+
+def get_blobs_prefix(campaign_id: str) -> str:
+    return f"{BLOBS_PREFIX}/{campaign_id}"
+
+
+def hash_file(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_blob_key(blobs: str, digest: str, codec: str) -> str:
+    return f"{blobs}/{digest}" if codec == "tar" else f"{blobs}/{digest}.{codec}"
+
+
+def put_blob(
+    storage: Storage, path: pathlib.Path, key: str, codec: str, level: int = None
+) -> int:
+    """
+    Upload the file compressed on the fly
+
+    :param storage: storage of the blobs
+    :param path: uploaded file
+    :param key: object name of the blob
+    :param codec: one of the BLOB_PROGRAMS
+    :param level: compression level, codec default if not defined
+    :return: size of the stored blob
+    """
+    program = BLOB_PROGRAMS[codec]
+    if not program:
+        storage.put(path, key)
+        return path.stat().st_size
+    cmd = [program, "-c", *([f"-{level}"] if level is not None else [])]
+    with open(path, "rb") as fd, subprocess.Popen(
+        cmd, stdin=fd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    ) as proc:
+        stream = CountingReader(proc.stdout)
+        try:
+            storage.put_stream(stream, key)
+        except BaseException:
+            proc.kill()
+            raise
+        stderr = proc.stderr.read()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    return stream.size
+
+
+def get_blob(storage: Storage, key: str, path: pathlib.Path, codec: str):
+    """
+    Download the blob decompressed on the fly
+
+    :param storage: storage of the blobs
+    :param key: object name of the blob
+    :param path: destination file
+    :param codec: one of the BLOB_PROGRAMS
+    """
+    program = BLOB_PROGRAMS[codec]
+    if not program:
+        storage.get(key, path)
+        return
+    cmd = [program, "-d", "-c"]
+    stream = storage.get_stream(key)
+    try:
+        with open(path, "wb") as fd, subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=fd, stderr=subprocess.PIPE
+        ) as proc:
+            try:
+                shutil.copyfileobj(stream, proc.stdin)
+            finally:
+                proc.stdin.close()
+            stderr = proc.stderr.read()
+    finally:
+        stream.close()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+def put_manifest(storage: Storage, manifest: dict, key: str):
+    storage.put_stream(io.BytesIO(json.dumps(manifest).encode()), key)
+
+
+def get_manifest(storage: Storage, key: str) -> dict:
+    stream = storage.get_stream(key)
+    try:
+        return json.load(stream)
+    finally:
+        stream.close()
+
+
+def fetch_files(
+    storage: Storage, manifest: dict, out_dir: pathlib.Path, folder: str = None
+):
+    """
+    Download the files of the manifest
+
+    :param storage: storage of the blobs
+    :param manifest: workdir manifest, see WorkdirSync.manifest
+    :param out_dir: destination workdir
+    :param folder: download only the files of the workdir folder
+    """
+    for name, digest in manifest["files"].items():
+        if folder and not name.startswith(f"{folder}/"):
+            continue
+        path = out_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # manifests without the codec are of the uncompressed blobs
+        codec = manifest.get("codec", "tar")
+        get_blob(storage, get_blob_key(manifest["blobs"], digest, codec), path, codec)
+
+
+class WorkdirSync:
+    """
+    Incremental content addressed upload of the pipeline workdir: the new and
+    changed (size, mtime) files are stored once per content as
+    "_blobs/{campaign_id}/{sha256}[.{codec}]", compressed by the PACK_CODEC,
+    and the manifest maps the workdir names to the blobs. Monitor dumps are
+    named with the offset (seconds fuzzed before the resumed run), so the
+    manifest keeps the absolute time axis
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        campaign_id: str,
+        workdir: pathlib.Path,
+        codec: str = config.PACK_CODEC,
+        level: int = config.PACK_LEVEL,
+    ):
+        """
+        :param storage: storage of the blobs
+        :param campaign_id: fuzzing campaign id
+        :param workdir: synced workdir
+        :param codec: compression of the blobs, one of the BLOB_PROGRAMS
+        :param level: compression level, codec default if not defined
+        """
+        self._storage = storage
+        self._blobs = get_blobs_prefix(campaign_id)
+        self._workdir = workdir
+        self._codec = codec
+        self._level = level
+        self._files: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._uploaded: Set[str] = set()
+        self.offset = 0
+        # totals of the uploaded blobs
+        self.uploaded_objects = 0
+        self.uploaded_bytes = 0
+
+    def _stored_name(self, name: str) -> str:
+        directory, _, file = name.rpartition("/")
+        if self.offset and directory == MONITOR_DIR and file.isdigit():
+            return f"{MONITOR_DIR}/{int(file) + self.offset}"
+        return name
+
+    def sync(self, limit: Optional[int] = None, prune: bool = False) -> int:
+        """
+        Upload the files changed since the previous sync
+
+        :param limit: maximum number of the uploaded blobs, the rest of the
+            changed files are left for the next sync
+        :param prune: forget the files removed from the workdir
+        :return: number of the uploaded blobs
+        """
+        uploaded = 0
+        seen = set()
+        for root, _, files in os.walk(self._workdir):
+            for file in files:
+                path = pathlib.Path(root) / file
+                name = self._stored_name(str(path.relative_to(self._workdir)))
+                seen.add(name)
+                if limit is not None and uploaded >= limit:
+                    continue
+                try:
+                    # the version is taken before hashing, a file changed while
+                    # hashed is synced again next time
+                    stat = path.stat()
+                    version = (stat.st_size, stat.st_mtime_ns)
+                    if self._files.get(name, (None,))[0] == version:
+                        continue
+                    digest = hash_file(path)
+                except FileNotFoundError:
+                    continue
+                if digest not in self._uploaded:
+                    key = get_blob_key(self._blobs, digest, self._codec)
+                    size = put_blob(self._storage, path, key, self._codec, self._level)
+                    self._uploaded.add(digest)
+                    uploaded += 1
+                    self.uploaded_objects += 1
+                    self.uploaded_bytes += size
+                self._files[name] = (version, digest)
+        if prune:
+            for name in set(self._files) - seen:
+                del self._files[name]
+        if uploaded:
+            logger.debug(f"Synced {uploaded} files of {self._workdir}")
+        return uploaded
+
+    def manifest(self) -> dict:
+        return {
+            "blobs": self._blobs,
+            "codec": self._codec,
+            "files": {name: digest for name, (_, digest) in self._files.items()},
+        }
+
+    def restore(self, manifest: dict):
+        """Download the files of the manifest into the workdir"""
+        fetch_files(self._storage, manifest, self._workdir)
+        for name, digest in manifest["files"].items():
+            stat = (self._workdir / name).stat()
+            self._files[name] = ((stat.st_size, stat.st_mtime_ns), digest)
+            # blobs of another codec are uploaded again under their own names
+            if manifest.get("codec", "tar") == self._codec:
+                self._uploaded.add(digest)
@@ -1,17 +1,126 @@
-from celery import Celery, chord
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from celery import Celery, Task, states
+from celery.signals import (
+    before_task_publish,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
+from celery.utils import uuid
+from celery.worker.control import inspect_command
 
 from backend import config, storage, schema
 from backend.worker import service
+from backend.worker.build_cache import build_cache_factory
+from backend.worker.checkpoint import get_checkpoint_prefix
+from backend.worker.dataset import delete_dataset
+from backend.worker.dispatcher import dispatcher_factory
+from backend.worker import metrics, site
+from backend.worker.sync import get_blobs_prefix
+from backend.worker.result_cache import result_cache_factory
+from backend.worker.resources import ResourceAllocator, get_affinity
 
 
+logger = logging.getLogger("worker")
 FUZZING_TASK_NAME = "fuzzing-task"
+BUILD_TASK_NAME = "build-task"
 BROKER = f"amqp://{config.BROKER_USER}:{config.BROKER_PASS}@{config.BROKER_HOST}:5672"
 BACKEND = f"redis://{config.REDIS_HOST}:{config.REDIS_PORT}"
 app = Celery("dmagma-fuzz", broker=BROKER, backend=BACKEND)
-app.conf.task_routes = {FUZZING_TASK_NAME: {"queue": config.FUZZING_TASK_QUEUE}}
+app.conf.task_routes = {
+    FUZZING_TASK_NAME: {"queue": config.FUZZING_TASK_QUEUE},
+    BUILD_TASK_NAME: {"queue": config.BUILD_TASK_QUEUE},
+}
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Create the S3 client once per (forked) worker process"""
+    if config.STORAGE_BACKEND != "s3":
+        return
+    storage.registry.reset()
+    storage.registry.client(
+        config.S3_ENDPOINT, config.S3_ACCESS_KEY, config.S3_SECRET_KEY, config.S3_REGION
+    )
+
+
+@worker_init.connect
+def init_worker(**kwargs):
+    """Serve the Prometheus metrics of the worker processes"""
+    if config.METRICS and config.METRICS_PORT:
+        metrics.start_exporter(config.METRICS_PORT)
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid: int, **kwargs):
+    metrics.mark_process_dead(pid)
+
+
+@before_task_publish.connect
+def mark_sent(headers: dict = None, **kwargs):
+    """Timestamp the task message to measure its queue wait"""
+    if headers is not None:
+        headers["sent_at"] = time.time()
+
+
+def get_task_metrics(task: Task) -> Optional[metrics.TaskMetrics]:
+    return metrics.task_metrics(task.name, task.request.get("sent_at"))
+
+
+@inspect_command()
+def resources(state) -> dict:
+    """Host resources of the fuzzing pipelines and their active leases"""
+    return ResourceAllocator().state()
+
+
+def get_fuzzing_slots() -> int:
+    """
+    :return: number of the fuzzing processes among the workers of the fuzzing queue
+    """
+    if config.FUZZING_SLOTS:
+        return config.FUZZING_SLOTS
+    inspect = app.control.inspect(timeout=config.INSPECT_TIMEOUT)
+    queues = inspect.active_queues() or {}
+    stats = inspect.stats() or {}
+    return sum(
+        stats.get(worker, {}).get("pool", {}).get("max-concurrency", 1)
+        for worker, worker_queues in queues.items()
+        if any(queue["name"] == config.FUZZING_TASK_QUEUE for queue in worker_queues)
+    )
 
 
-@app.task(bind=True, name=FUZZING_TASK_NAME)
+def get_queue_depth(queue: str = config.FUZZING_TASK_QUEUE) -> int:
+    with app.connection_for_read() as connection:
+        return connection.default_channel.queue_declare(
+            queue=queue, passive=True
+        ).message_count
+
+
+class FuzzTask(Task):
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        """Account the finished pipeline of the campaign and release the next ones"""
+        if status not in (states.SUCCESS, states.FAILURE):
+            return
+        campaign_id = kwargs.get("campaign_id", None) or (args[0] if args else None)
+        dispatcher = dispatcher_factory()
+        reused = dispatcher.complete(campaign_id, task_id, status == states.FAILURE)
+        if reused is not None:
+            report_task = reduce.delay(campaign_id, reused)
+            dispatcher.set_report_task(campaign_id, report_task.id)
+        dispatch.delay()
+
+
+@app.task(
+    bind=True,
+    base=FuzzTask,
+    name=FUZZING_TASK_NAME,
+    max_retries=config.RESOURCES_MAX_RETRIES,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
 def fuzz(
     self,
     campaign_id: str,
@@ -20,9 +129,17 @@ def fuzz(
     program: str,
     poll: int = 5,
     timeout: str = "1m",
+    cores: int = 1,
+    memory: int = None,
+    pipeline_key: str = None,
+    prebuilt: bool = False,
 ):
     """
-    Fuzzing task which have to be executed solely on the VM without neighbours
+    Fuzzing task pinned to the dedicated cores of the host, so several isolated
+    pipelines could share the VM. The task is postponed until the host has
+    enough free resources. Reports the monitor counters as the "PROGRESS" state
+    while fuzzing. The task is acknowledged after the return, so the pipeline
+    of the lost worker is redelivered and resumed from its last checkpoint
 
     :param self: Task instance
     :param campaign_id: fuzzing campaign id
@@ -31,61 +148,286 @@ def fuzz(
     :param program: target program name
     :param poll: monitor poll interval in seconds
     :param timeout: fuzzing interval
-    :return: json S3 object name
+    :param cores: number of the dedicated cores
+    :param memory: required memory in MiB
+    :param pipeline_key: content key to index the results for the reuse
+    :param prebuilt: the image is built by the build task, only pull it
+    :return: object name of the results and the task metrics (METRICS)
     """
-    storage_in = storage.s3_factory(config.BUCKET_FUZZ_RESULTS)
+    storage_in = storage.storage_factory(config.BUCKET_FUZZ_RESULTS)
     pipeline_id = self.request.id
     if not pipeline_id:
         raise service.WorkerException(
             "Fuzzing pipeline id is undefined. Running locally?"
         )
-    workdir, shared = service.get_workdir_and_shared(pipeline_id)
-    report = service.run_fuzz_pipeline(
-        campaign_id,
-        pipeline_id,
-        fuzzer,
-        target,
-        program,
-        shared,
-        workdir,
-        poll,
-        timeout,
-        storage_in,
-    )
-    return report
+    allocator = ResourceAllocator()
+    if not allocator.fits(cores, memory):
+        # retrying would only spin until RESOURCES_MAX_RETRIES
+        raise service.WorkerException(
+            f"Pipeline requires {cores} cores and {memory or 0} MiB, "
+            "more than the fuzzing host has"
+        )
+    pinned = allocator.acquire(pipeline_id, cores, memory)
+    if pinned is None:
+        raise self.retry(countdown=config.RESOURCES_RETRY_DELAY)
+    task_metrics = get_task_metrics(self)
+    try:
+        workdir, shared = service.get_workdir_and_shared(pipeline_id)
+        report = service.run_fuzz_pipeline(
+            campaign_id,
+            pipeline_id,
+            fuzzer,
+            target,
+            program,
+            shared,
+            workdir,
+            poll,
+            timeout,
+            storage_in,
+            build_cache_factory(),
+            # called by the poller thread, self.request is local to the task thread
+            lambda meta: self.update_state(
+                task_id=pipeline_id, state="PROGRESS", meta=meta
+            ),
+            get_affinity(pinned),
+            pipeline_key,
+            prebuilt,
+            task_metrics,
+        )
+    finally:
+        allocator.release(pipeline_id)
+        if task_metrics:
+            task_metrics.export()
+    return {"result": report, "metrics": task_metrics and task_metrics.as_dict()}
+
+
+@app.task(
+    bind=True,
+    name=BUILD_TASK_NAME,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def build_image(self, campaign_id: str, fuzzer: str, target: str):
+    """
+    Build the fuzzer/target image of the campaign pipelines, the pipelines are
+    released into the fuzzing queue as soon as their image is ready. The build
+    is exclusive among the build workers, so the same image is built once and
+    the rest get it from the build cache. The task of the lost worker is
+    redelivered, its build lock expires after BUILD_LOCK_TIMEOUT
+
+    :param campaign_id: fuzzing campaign id
+    :param fuzzer: fuzzer name
+    :param target: target name
+    :return: task metrics (METRICS)
+    """
+    dispatcher = dispatcher_factory()
+    task_metrics = get_task_metrics(self)
+    try:
+        with dispatcher.build_lock(fuzzer, target):
+            with (task_metrics or metrics.NULL_METRICS).phase("build"):
+                service.build(fuzzer, target, build_cache_factory())
+    except Exception:
+        reused = dispatcher.build_failed(campaign_id, fuzzer, target)
+        if reused is not None:
+            report_task = reduce.delay(campaign_id, reused)
+            dispatcher.set_report_task(campaign_id, report_task.id)
+        raise
+    finally:
+        if task_metrics:
+            task_metrics.export()
+    dispatcher.built(campaign_id, fuzzer, target)
+    dispatch.delay()
+    return {"metrics": task_metrics and task_metrics.as_dict()}
+
+
+@app.task(bind=True)
+def reduce(self, campaign_id: str, reused: List[str] = None):
+    """
+    Generate the campaign report, its static site is rendered afterwards by
+    the render_site task (REPORT_SITE)
+
+    :return: object name of the report and the task metrics (METRICS)
+    """
+    storage_in = storage.storage_factory(config.BUCKET_FUZZ_RESULTS)
+    storage_out = storage.storage_factory(config.BUCKET_REPORTS)
+    task_metrics = get_task_metrics(self)
+    try:
+        service.reduce(
+            campaign_id,
+            storage_in,
+            storage_out,
+            reused,
+            cache=result_cache_factory(),
+            metrics=task_metrics,
+        )
+    finally:
+        if task_metrics:
+            task_metrics.export()
+    if config.REPORT_SITE:
+        render_site.delay(campaign_id)
+    return {
+        "result": service.get_report_key(campaign_id),
+        "metrics": task_metrics and task_metrics.as_dict(),
+    }
+
+
+@app.task(bind=True)
+def render_site(self, campaign_id: str):
+    """
+    Render the static site of the campaign report, only the fuzzer/target
+    slices changed since the previous rendering are rendered again
+
+    :param campaign_id: fuzzing campaign id
+    :return: numbers of the rendered and the skipped slices and the task metrics
+    """
+    storage_out = storage.storage_factory(config.BUCKET_REPORTS)
+    task_metrics = get_task_metrics(self)
+    try:
+        result = site.render_site(campaign_id, storage_out, metrics=task_metrics)
+    finally:
+        if task_metrics:
+            task_metrics.export()
+    return {"result": result, "metrics": task_metrics and task_metrics.as_dict()}
 
 
 @app.task
-def reduce(campaign_id: str):
-    storage_in = storage.s3_factory(config.BUCKET_FUZZ_RESULTS)
-    storage_out = storage.s3_factory(config.BUCKET_REPORTS)
-    service.reduce(campaign_id, storage_in, storage_out)
+def delete_campaign(campaign_id: str):
+    """
+    Delete the fuzzing results and the report of the campaign, suitable for the
+    periodic cleanup
+
+    :param campaign_id: fuzzing campaign id
+    """
+    storage_in = storage.storage_factory(config.BUCKET_FUZZ_RESULTS)
+    storage_in.delete_prefix(f"{campaign_id}/")
+    storage_in.delete_prefix(f"{get_checkpoint_prefix(campaign_id)}/")
+    storage_in.delete_prefix(f"{get_blobs_prefix(campaign_id)}/")
+    service.delete_index(storage_in, campaign_id)
+    storage_out = storage.storage_factory(config.BUCKET_REPORTS)
+    storage_out.delete(service.get_report_key(campaign_id))
+    delete_dataset(storage_out, campaign_id)
+    storage_out.delete_prefix(f"{site.get_site_prefix(campaign_id)}/")
 
 
 @app.task
-def start_campaign(campaign: dict) -> str:
+def dispatch():
+    """
+    Release the next round of the campaigns pipelines into the fuzzing queue,
+    sized to the free fuzzing slots
     """
-    Start the Magma benchmark campaign
+    dispatcher = dispatcher_factory()
+    with dispatcher.lock():
+        capacity = get_fuzzing_slots() - dispatcher.inflight()
+        for campaign_id, kwargs in dispatcher.next_round(capacity):
+            pipeline_id = uuid()
+            dispatcher.release(campaign_id, pipeline_id)
+            fuzz.apply_async(kwargs=kwargs, task_id=pipeline_id)
+        pending = dispatcher.pending()
+    # fallback if no slots are available yet, the finished pipelines dispatch too
+    if pending and dispatcher.schedule(config.DISPATCH_INTERVAL):
+        dispatch.apply_async(countdown=config.DISPATCH_INTERVAL)
 
-    :param campaign: campaign configuration dictionary
-    :return: task id of the chord of the fuzzing tasks
+
+@app.task
+def campaign_status(campaign_id: str) -> Optional[dict]:
+    """
+    :param campaign_id: fuzzing campaign id
+    :return: campaign pipelines progress and the fuzzing queue depth
+    """
+    progress = dispatcher_factory().progress(campaign_id)
+    if progress is None:
+        return None
+    return {**progress, "queue_depth": get_queue_depth()}
+
+
+def expand_pipelines(
+    campaign: schema.Campaign, storage_in: storage.Storage
+) -> Tuple[List[dict], List[str]]:
+    """
+    Every trial of the program is a separate fuzzing pipeline (run). If the
+    campaign allows the reuse, the trials already done by the identical indexed
+    pipelines are not fuzzed again, their previous results are reduced instead
+
+    :param campaign: campaign configuration
+    :param storage_in: storage of the fuzzing results
+    :return: fuzz task kwargs of the pipelines and the reused result prefixes
     """
-    campaign = schema.Campaign.parse_obj(campaign)
     campaign_id = campaign.id
+    revision = service.get_magma_revision()
+    if campaign.reuse and not revision:
+        logger.warning(
+            f'Reuse of the campaign "{campaign_id}" is disabled, '
+            "the Magma revision is unknown (MAGMA_REVISION)"
+        )
     fuzzing_pipelines = []
+    reused = []
     for fuzzer in campaign.fuzzers:
         for target in fuzzer.targets:
             for program in target.programs:
-                args = (
-                    campaign_id,
-                    fuzzer.name,
-                    target.name,
-                    program.name,
-                    campaign.poll,
-                    f"{campaign.timeout}s",
+                timeout = f"{campaign.timeout}s"
+                pipeline_key = None
+                if revision:
+                    pipeline_key = service.get_pipeline_key(
+                        fuzzer.name,
+                        target.name,
+                        program.name,
+                        program.args,
+                        timeout,
+                        revision,
+                    )
+                trials = program.trials or fuzzer.trials or campaign.trials
+                reused_trials = []
+                if campaign.reuse and pipeline_key:
+                    results = service.find_results(storage_in, pipeline_key)
+                    reused_trials = results[:trials]
+                reused.extend(reused_trials)
+                kwargs = dict(
+                    campaign_id=campaign_id,
+                    fuzzer=fuzzer.name,
+                    target=target.name,
+                    program=program.name,
+                    poll=campaign.poll,
+                    timeout=timeout,
+                    cores=fuzzer.cores or campaign.cores,
+                    memory=fuzzer.memory or campaign.memory,
+                    pipeline_key=pipeline_key,
                 )
-                fuzzing_pipelines.append(args)
-    task = chord(
-        (fuzz.s(*args) for args in fuzzing_pipelines), reduce.si(campaign_id)
-    ).apply_async()
-    return task.id
+                for trial in range(len(reused_trials), trials):
+                    fuzzing_pipelines.append((trial, dict(kwargs)))
+    # trials are interleaved to spread the same program runs across the workers
+    fuzzing_pipelines = [
+        kwargs for _, kwargs in sorted(fuzzing_pipelines, key=lambda x: x[0])
+    ]
+    return fuzzing_pipelines, reused
+
+
+@app.task
+def start_campaign(campaign: dict) -> str:
+    """
+    Start the Magma benchmark campaign: the images of its fuzzer/target pairs
+    are built in the build queue (BUILD_STAGE), the pipelines of every built
+    pair are released into the fuzzing queue by the fair-share dispatcher, the
+    report is generated as soon as the last pipeline is finished
+
+    :param campaign: campaign configuration dictionary
+    :return: campaign id, see campaign_status
+    """
+    campaign = schema.Campaign.parse_obj(campaign)
+    campaign_id = campaign.id
+    storage_in = storage.storage_factory(config.BUCKET_FUZZ_RESULTS)
+    pipelines, reused = expand_pipelines(campaign, storage_in)
+    builds = sorted({(kwargs["fuzzer"], kwargs["target"]) for kwargs in pipelines})
+    gated = bool(config.BUILD_STAGE)
+    for kwargs in pipelines:
+        kwargs["prebuilt"] = gated
+    dispatcher = dispatcher_factory()
+    dispatcher.submit(campaign_id, campaign.priority, pipelines, reused, gated)
+    if pipelines and gated:
+        for fuzzer, target in builds:
+            build_image.delay(campaign_id, fuzzer, target)
+    elif pipelines:
+        dispatch.delay()
+    else:
+        report_task = reduce.delay(campaign_id, dispatcher.finish(campaign_id))
+        dispatcher.set_report_task(campaign_id, report_task.id)
+    return campaign_id
@@ -1,13 +1,93 @@
+import os
 import pathlib
 import shutil
+import threading
+import uuid
+from typing import Optional
 
 
-def cleanup_folder(folder: pathlib.Path):
-    for path in folder.glob("**/*"):
-        if path.is_file():
-            path.unlink()
-        elif path.is_dir():
-            shutil.rmtree(path)
+def _remove_trees(*paths: pathlib.Path):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def cleanup_folder(
+    folder: pathlib.Path, background: bool = False
+) -> Optional[threading.Thread]:
+    """
+    Remove the content of the folder keeping the folder itself
+
+    :param folder: folder to clean up
+    :param background: move the content aside (same filesystem rename) and
+        delete it in a thread, the folder is empty right after the call
+    :return: deleting thread in the background mode
+    """
+    if background:
+        trash = folder.parent / f".{folder.name}.trash-{uuid.uuid4().hex}"
+        trash.mkdir()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                os.rename(entry.path, trash / entry.name)
+        # trash of the previous runs could be left if the process has been killed
+        trashes = list(folder.parent.glob(f".{folder.name}.trash-*"))
+        thread = threading.Thread(target=_remove_trees, args=trashes, daemon=True)
+        thread.start()
+        return thread
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    return None
+
+
+def link_tree(src: pathlib.Path, dst: pathlib.Path):
+    """
+    Recreate the folder tree with hard links to the source files, the files are
+    copied (reflinked by the filesystem if supported) across the filesystems
+
+    :param src: source folder
+    :param dst: destination folder, merged with the existing content
+    """
+    for root, _, files in os.walk(src):
+        folder = dst / pathlib.Path(root).relative_to(src)
+        folder.mkdir(parents=True, exist_ok=True)
+        for file in files:
+            try:
+                os.link(os.path.join(root, file), folder / file)
+            except OSError:
+                shutil.copy2(os.path.join(root, file), folder / file)
+
+
+def merge_dicts(dst: dict, src: dict) -> dict:
+    """
+    Recursively merge the source dictionary into the destination one
+
+    :param dst: destination dictionary, updated in place
+    :param src: source dictionary, its values win on conflicts
+    :return: destination dictionary
+    """
+    for key, value in src.items():
+        if isinstance(value, dict) and isinstance(dst.get(key, None), dict):
+            merge_dicts(dst[key], value)
+        else:
+            dst[key] = value
+    return dst
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600}
+
+
+def parse_duration(duration: str) -> int:
+    """
+    :param duration: captain timeout, seconds with an optional unit suffix ("15m")
+    :return: duration in seconds
+    """
+    duration = duration.strip()
+    if duration and duration[-1] in DURATION_UNITS:
+        return int(float(duration[:-1]) * DURATION_UNITS[duration[-1]])
+    return int(float(duration))
 
 
 def is_docker() -> bool:
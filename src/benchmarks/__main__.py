@@ -0,0 +1,144 @@
+"""
+Benchmark of the dMagma overhead of the fuzzing pipelines and the reduce over the
+fake captain (see magma/tools), which instantly creates the synthetic workdirs:
+
+    cd src
+    python -m benchmarks --pipelines 1 10 100 1000 --output results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+from typing import Iterator
+
+FAKE_MAGMA_PATH = pathlib.Path(__file__).parent / "magma"
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def storage_env(storage: str, tmp_dir: pathlib.Path) -> Iterator[None]:
+    """Configure the storage backend before the backend is imported"""
+    if storage == "local":
+        os.environ["STORAGE_BACKEND"] = "local"
+        os.environ["LOCAL_STORAGE_PATH"] = str(tmp_dir / "storage")
+        yield
+    elif storage == "moto":
+        from moto.server import ThreadedMotoServer
+
+        port = get_free_port()
+        server = ThreadedMotoServer(port=port, verbose=False)
+        server.start()
+        os.environ["STORAGE_BACKEND"] = "s3"
+        os.environ["S3_ENDPOINT"] = f"http://127.0.0.1:{port}"
+        try:
+            yield
+        finally:
+            server.stop()
+    else:
+        # the configured S3 service, e.g. the local MinIO
+        os.environ["STORAGE_BACKEND"] = "s3"
+        yield
+
+
+def get_revision() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=pathlib.Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pipelines", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--files", type=int, default=100, help="workdir files")
+    parser.add_argument("--file-size", type=int, default=4096, help="bytes")
+    parser.add_argument("--fuzzers", type=int, default=2)
+    parser.add_argument("--targets", type=int, default=4)
+    parser.add_argument("--poll", type=int, default=5)
+    parser.add_argument("--timeout", default="600s", help="fake fuzzing time")
+    parser.add_argument("--storage", choices=["moto", "local", "s3"], default="moto")
+    parser.add_argument(
+        "--workdir-sync",
+        type=int,
+        choices=[0, 1],
+        default=1,
+        help="upload the workdir blobs (1) or the packed archive (0)",
+    )
+    parser.add_argument("--codec", choices=["tar", "gz", "zst"], default="tar")
+    parser.add_argument("--level", type=int, help="compression level of the codec")
+    parser.add_argument(
+        "--no-summaries",
+        dest="summaries",
+        action="store_false",
+        help="reduce by exp2json.py instead of merging the pipeline summaries",
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="JSON results file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dmagma-bench-") as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        os.environ["MAGMA_PATH"] = str(FAKE_MAGMA_PATH.absolute())
+        os.environ["SHARED_PATH"] = os.environ["SHARED_VOLUME"] = str(
+            tmp_dir / "shared"
+        )
+        os.environ["BENCH_FILES"] = str(args.files)
+        os.environ["BENCH_FILE_SIZE"] = str(args.file_size)
+        os.environ["WORKDIR_SYNC"] = str(args.workdir_sync)
+        os.environ["PACK_CODEC"] = args.codec
+        if args.level is not None:
+            os.environ["PACK_LEVEL"] = str(args.level)
+        with storage_env(args.storage, tmp_dir):
+            # the backend configuration is read on import
+            from benchmarks import pipelines
+
+            logging.getLogger().setLevel(logging.WARNING)
+            results = pipelines.run(
+                args.pipelines,
+                args.concurrency,
+                args.fuzzers,
+                args.targets,
+                args.poll,
+                args.timeout,
+                args.summaries,
+            )
+    output = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "revision": get_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {
+                name: str(value) if isinstance(value, pathlib.Path) else value
+                for name, value in vars(args).items()
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(output, fd, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Fake exp2json.py of the benchmarks, the same report layout as Magma's one"""
+
+import csv
+import json
+import os
+import sys
+import tarfile
+import tempfile
+
+
+def get_events(monitor: str) -> dict:
+    events = {"reached": {}, "triggered": {}}
+    timestamps = sorted((int(name) for name in os.listdir(monitor) if name.isdigit()))
+    for timestamp in timestamps:
+        with open(os.path.join(monitor, str(timestamp))) as fd:
+            for row in csv.DictReader(fd):
+                for column, value in row.items():
+                    event = "reached" if column.endswith("_R") else "triggered"
+                    if int(value) and column[:-2] not in events[event]:
+                        events[event][column[:-2]] = timestamp
+    return events
+
+
+def main(workdir: str, report: str):
+    ar = os.path.join(workdir, "ar")
+    results = {}
+    for fuzzer in os.listdir(ar):
+        for target in os.listdir(os.path.join(ar, fuzzer)):
+            for program in os.listdir(os.path.join(ar, fuzzer, target)):
+                for run in os.listdir(os.path.join(ar, fuzzer, target, program)):
+                    path = os.path.join(ar, fuzzer, target, program, run)
+                    with tempfile.TemporaryDirectory() as tmp_dir:
+                        monitor = os.path.join(path, "monitor")
+                        if os.path.isfile(os.path.join(path, "ball.tar")):
+                            with tarfile.open(os.path.join(path, "ball.tar")) as tar:
+                                members = [
+                                    m
+                                    for m in tar.getmembers()
+                                    if m.name.startswith("./monitor")
+                                ]
+                                tar.extractall(tmp_dir, members)
+                            monitor = os.path.join(tmp_dir, "monitor")
+                        results.setdefault(fuzzer, {}).setdefault(
+                            target, {}
+                        ).setdefault(program, {})[run] = get_events(monitor)
+    with open(report, "w") as fd:
+        json.dump({"results": results}, fd)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
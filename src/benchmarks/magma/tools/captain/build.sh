@@ -0,0 +1,3 @@
+#!/bin/bash
+# Fake captain build of the benchmarks: the image build is out of the scope
+echo "Building $FUZZER/$TARGET (fake)"
@@ -0,0 +1,28 @@
+#!/bin/bash
+# Fake captain run of the benchmarks: instantly creates the synthetic workdir with
+# BENCH_FILES corpus files of BENCH_FILE_SIZE bytes and the monitor dumps of TIMEOUT
+set -e
+WORKDIR="$SHARED/$PIPELINE_ID"
+python3 - "$WORKDIR" "${TIMEOUT%s}" "$POLL" <<'PY'
+import os
+import pathlib
+import random
+import sys
+
+workdir, timeout, poll = pathlib.Path(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+files = int(os.environ.get("BENCH_FILES", "100"))
+size = int(os.environ.get("BENCH_FILE_SIZE", "4096"))
+bugs = [f"BUG{i:03d}" for i in range(int(os.environ.get("BENCH_BUGS", "10")))]
+(workdir / "corpus").mkdir(parents=True, exist_ok=True)
+(workdir / "monitor").mkdir(parents=True, exist_ok=True)
+for i in range(files):
+    (workdir / "corpus" / f"id:{i:06d}").write_bytes(os.urandom(size))
+reached = {bug: random.randrange(0, timeout + 1) for bug in bugs}
+header = ",".join(f"{bug}{event}" for bug in bugs for event in ("_R", "_T"))
+for timestamp in range(0, timeout + 1, poll):
+    row = ",".join(
+        f"{int(reached[bug] <= timestamp)},{int(reached[bug] * 2 <= timestamp)}"
+        for bug in bugs
+    )
+    (workdir / "monitor" / str(timestamp)).write_text(f"{header}\n{row}\n")
+PY
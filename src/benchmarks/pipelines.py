@@ -0,0 +1,161 @@
+import os
+import pathlib
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from backend import config
+from backend.storage import Storage, storage_factory
+from backend.worker import service, sync
+from backend.worker.checkpoint import get_checkpoint_prefix
+from backend.worker.dataset import delete_dataset
+from benchmarks.recorder import Recorder
+
+
+def instrument(recorder: Recorder, storages: List[Storage]):
+    """Measure the phases of the fuzzing pipeline, reduce and storage calls"""
+    recorder.wrap(service, "cleanup_folder", "fuzz.cleanup")
+    recorder.wrap(service, "build", "fuzz.build")
+    recorder.wrap(service, "start", "fuzz.start")
+    recorder.wrap(sync.WorkdirSync, "sync", "fuzz.sync")
+    # archive of the WORKDIR_SYNC=0 pipelines, streamed into the upload
+    recorder.wrap_context(service, "pack_stream", "fuzz.pack")
+    recorder.wrap(service, "summarize", "fuzz.summarize")
+    # exp2json.py of the pipeline summaries and the reduce without them
+    recorder.wrap(service, "generate_report", "exp2json")
+    recorder.wrap(service, "fetch_results", "reduce.fetch")
+    recorder.wrap(service, "generate_sharded_report", "reduce.report")
+    recorder.wrap(service, "merge_reports", "reduce.merge")
+    for storage in storages:
+        recorder.wrap(
+            storage, "put", "storage.put", lambda args, _: os.path.getsize(args[0])
+        )
+        recorder.wrap(
+            storage, "get", "storage.get", lambda args, _: os.path.getsize(args[1])
+        )
+        recorder.wrap_stream(storage, "put_stream", "storage.put_stream", arg=0)
+        recorder.wrap_stream(storage, "get_stream", "storage.get_stream")
+
+
+def run_pipelines(
+    campaign_id: str,
+    count: int,
+    concurrency: int,
+    fuzzers: int,
+    targets: int,
+    storage: Storage,
+    recorder: Recorder,
+    poll: int,
+    timeout: str,
+):
+    def run(i: int):
+        pipeline_id = str(uuid.uuid4())
+        workdir, shared = service.get_workdir_and_shared(pipeline_id)
+        try:
+            with recorder.measure("fuzz.pipeline"):
+                service.run_fuzz_pipeline(
+                    campaign_id,
+                    pipeline_id,
+                    f"fuzzer{i % fuzzers}",
+                    f"target{i % targets}",
+                    "program",
+                    shared,
+                    workdir,
+                    poll,
+                    timeout,
+                    storage,
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(run, i) for i in range(count)]:
+            future.result()
+
+
+def delete_summaries(campaign_id: str, results: Storage):
+    for key in results.list(prefix=f"{campaign_id}/"):
+        if key.endswith(f"/{service.SUMMARY_NAME}"):
+            results.delete(key)
+
+
+def delete_campaign(campaign_id: str, results: Storage, reports: Storage):
+    results.delete_prefix(f"{campaign_id}/")
+    results.delete_prefix(f"{sync.get_blobs_prefix(campaign_id)}/")
+    results.delete_prefix(f"{get_checkpoint_prefix(campaign_id)}/")
+    reports.delete(service.get_report_key(campaign_id))
+    delete_dataset(reports, campaign_id)
+
+
+def run(
+    pipelines: List[int],
+    concurrency: int,
+    fuzzers: int,
+    targets: int,
+    poll: int,
+    timeout: str,
+    summaries: bool = True,
+) -> List[dict]:
+    """
+    Run the fuzzing pipelines and the reduce of every campaign size
+
+    :param pipelines: campaign sizes
+    :param concurrency: number of the simultaneous pipelines
+    :param fuzzers: number of the fuzzers the pipelines are spread over
+    :param targets: number of the targets the pipelines are spread over
+    :param poll: monitor poll interval of the fake captain
+    :param timeout: fuzzing time of the fake captain (monitor dumps)
+    :param summaries: reduce the pipeline summaries, otherwise they are deleted
+        before the reduce, so it runs exp2json.py over all the pipeline results
+    :return: per phase statistics of every campaign size
+    """
+    results_storage = storage_factory("bench-fuzz-results")
+    reports_storage = storage_factory("bench-reports")
+    recorder = Recorder()
+    instrument(recorder, [results_storage, reports_storage])
+    pathlib.Path(config.SHARED_PATH).mkdir(parents=True, exist_ok=True)
+    results = []
+    for count in pipelines:
+        campaign_id = f"bench-{count}-{uuid.uuid4()}"
+        stages = (
+            (
+                "fuzz",
+                lambda: run_pipelines(
+                    campaign_id,
+                    count,
+                    concurrency,
+                    fuzzers,
+                    targets,
+                    results_storage,
+                    recorder,
+                    poll,
+                    timeout,
+                ),
+            ),
+            (
+                "reduce",
+                lambda: service.reduce(campaign_id, results_storage, reports_storage),
+            ),
+        )
+        try:
+            for stage, func in stages:
+                recorder.clear()
+                start = time.perf_counter()
+                func()
+                wall = time.perf_counter() - start
+                if stage == "fuzz" and not summaries:
+                    delete_summaries(campaign_id, results_storage)
+                results.append(
+                    {
+                        "pipelines": count,
+                        "stage": stage,
+                        "wall_s": wall,
+                        "pipelines_per_s": count / wall,
+                        "phases": recorder.summary(),
+                    }
+                )
+        finally:
+            delete_campaign(campaign_id, results_storage, reports_storage)
+    return results
@@ -0,0 +1,159 @@
+import contextlib
+import functools
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+from backend.worker.metrics import CountingReader
+
+
+class CountingStream(CountingReader):
+    """Closable CountingReader reporting the read bytes on close"""
+
+    def __init__(self, stream: BinaryIO, on_close: Callable[[int], None] = None):
+        super().__init__(stream)
+        self._on_close = on_close
+
+    def close(self):
+        self._stream.close()
+        if self._on_close:
+            self._on_close(self.size)
+            self._on_close = None
+
+    def __enter__(self) -> "CountingStream":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Recorder:
+    """Thread-safe collector of the phase durations and transferred bytes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+
+    def add(self, phase: str, seconds: float, size: int = 0):
+        with self._lock:
+            self._samples[phase].append((seconds, size))
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def wrap(
+        self,
+        owner: Any,
+        name: str,
+        phase: str,
+        size: Callable[[tuple, Any], int] = None,
+    ):
+        """
+        Replace the function attribute by the measured one
+
+        :param owner: module, class or instance
+        :param name: function attribute name
+        :param phase: phase name
+        :param size: transferred bytes of the call from its arguments and result
+        """
+        func = getattr(owner, name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.add(
+                phase, time.perf_counter() - start, size(args, result) if size else 0
+            )
+            return result
+
+        setattr(owner, name, wrapper)
+
+    def wrap_stream(self, owner: Any, name: str, phase: str, arg: int = None):
+        """
+        Measure the function reading (the stream argument) or returning the
+        stream, the returned stream is measured until it is closed
+
+        :param arg: index of the stream argument, the result stream if None
+        """
+        func = getattr(owner, name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            if arg is not None:
+                stream = CountingStream(args[arg])
+                args = (*args[:arg], stream, *args[arg + 1 :])
+                result = func(*args, **kwargs)
+                self.add(phase, time.perf_counter() - start, stream.size)
+                return result
+            return CountingStream(
+                func(*args, **kwargs),
+                lambda size: self.add(phase, time.perf_counter() - start, size),
+            )
+
+        setattr(owner, name, wrapper)
+
+    def wrap_context(self, owner: Any, name: str, phase: str):
+        """
+        Measure the context manager yielding the readable stream, from entering
+        it until its exit, with the bytes read from the stream
+
+        :param owner: module, class or instance
+        :param name: context manager function attribute name
+        :param phase: phase name
+        """
+        func = getattr(owner, name)
+
+        @functools.wraps(func)
+        @contextlib.contextmanager
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            stream = None
+            try:
+                with func(*args, **kwargs) as result:
+                    stream = CountingStream(result)
+                    yield stream
+            finally:
+                size = stream.size if stream else 0
+                self.add(phase, time.perf_counter() - start, size)
+
+        setattr(owner, name, wrapper)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            samples = dict(self._samples)
+        results = []
+        for phase, values in sorted(samples.items()):
+            durations = sorted(seconds for seconds, _ in values)
+            total = sum(durations)
+            size = sum(size for _, size in values)
+            results.append(
+                {
+                    "phase": phase,
+                    "count": len(durations),
+                    "total_s": total,
+                    "mean_s": statistics.mean(durations),
+                    "p50_s": durations[len(durations) // 2],
+                    "p95_s": durations[
+                        min(len(durations) - 1, len(durations) * 95 // 100)
+                    ],
+                    "max_s": durations[-1],
+                    "bytes": size,
+                    "throughput_mib_s": (
+                        size / total / 1024**2 if total and size else None
+                    ),
+                }
+            )
+        return results
@@ -0,0 +1,3 @@
+# Workers building the fuzzer/target images over the "build-queue" queue, the fuzzing workers
+# only pull the prebuilt images (from the build cache registry or the shared docker daemon)
+celery -A backend.worker.tasks worker -c "${BUILD_CONCURRENCY:-2}" --prefetch-multiplier 1 -Q build-queue "$@"
\ No newline at end of file
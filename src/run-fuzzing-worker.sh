@@ -1,2 +1,3 @@
-# Only 1 worker per VM (-c 1) over the "fuzzing-queue" queue
-celery -A backend.worker.tasks worker -c 1 -Q fuzzing-queue "$@"
\ No newline at end of file
+# Fuzzing workers over the "fuzzing-queue" queue. Every pipeline is pinned to its own
+# cores, so the number of the concurrent pipelines per VM is limited by the host cores
+celery -A backend.worker.tasks worker -c "${FUZZING_CONCURRENCY:-1}" --prefetch-multiplier 1 -Q fuzzing-queue "$@"
@@ -1,2 +1,2 @@
-# Workers responsible to perform general tasks (excluding the fuzzing task - fuzzing-queue)
-celery -A backend.worker.tasks worker --autoscale=4,32 -X fuzzing-queue "$@"
\ No newline at end of file
+# Workers responsible to perform general tasks (excluding the fuzzing and build tasks - fuzzing-queue, build-queue)
+celery -A backend.worker.tasks worker --autoscale=4,32 -X fuzzing-queue,build-queue "$@"
\ No newline at end of file